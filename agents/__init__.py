@@ -6,7 +6,7 @@ from agents.agents import (
     MentorAgent,
     FactCheckerAgent,
     FeedbackGeneratorAgent,
-    create_internal_thought
+    create_thought
 )
 
 __all__ = [
@@ -14,5 +14,5 @@ __all__ = [
     "MentorAgent",
     "FactCheckerAgent",
     "FeedbackGeneratorAgent",
-    "create_internal_thought"
+    "create_thought"
 ]
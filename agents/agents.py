@@ -4,95 +4,234 @@
 Содержит классы агентов: InterviewerAgent, MentorAgent,
 FactCheckerAgent, FeedbackGeneratorAgent.
 """
+import asyncio
+import atexit
+import functools
+import hashlib
+import itertools
 import os
 import json
-from datetime import datetime
-from typing import Dict, Any
-from openai import OpenAI
+import time
+from typing import Dict, Any, List
+
+import httpx
+from openai import AsyncOpenAI
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 from config import (
     LLM_MODEL, LLM_TEMPERATURE,
     GROQ_API_KEY, GROQ_BASE_URL,
-    INTERVIEWER_SYSTEM_PROMPT, MENTOR_SYSTEM_PROMPT,
-    FACT_CHECKER_PROMPT, FEEDBACK_GENERATOR_PROMPT,
+    INTERVIEWER_SYSTEM_PROMPT, INTERVIEWER_CONTEXT_PROMPT,
+    MENTOR_SYSTEM_PROMPT,
+    FACT_CHECKER_PROMPT,
+    FEEDBACK_GENERATOR_SYSTEM_PROMPT, FEEDBACK_GENERATOR_PROMPT,
     TOPICS_BY_GRADE,
     ROLE_LABELS,
     TOPICS_BY_ROLE_AND_DIFFICULTY,
     TOPICS_BY_ROLE_AND_GRADE,
+    MENTOR_SCHEMA, FACTCHECK_SCHEMA, FEEDBACK_SCHEMA,
     detect_role_from_position
 )
 from state import InterviewState, InternalThought, Turn
 
-client = OpenAI(
-    api_key=GROQ_API_KEY,
-    base_url=GROQ_BASE_URL
-)
+# Строгие форматы структурированного вывода: модель не может вернуть
+# невалидный JSON, так что fallback-ветки разбора остаются лишь страховкой.
+_MENTOR_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "mentor_analysis", "schema": MENTOR_SCHEMA, "strict": True}
+}
+_FACTCHECK_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "fact_check", "schema": FACTCHECK_SCHEMA, "strict": True}
+}
+_FEEDBACK_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "interview_feedback", "schema": FEEDBACK_SCHEMA, "strict": True}
+}
+
+@functools.lru_cache(maxsize=1)
+def get_client() -> AsyncOpenAI:
+    """Возвращает общий асинхронный клиент LLM (создаётся лениво).
+
+    Все агенты переиспользуют один пул keep-alive соединений вместо
+    повторных TCP/TLS-рукопожатий. Ленивое создание через lru_cache
+    вместо модульной константы откладывает конструирование до первого
+    вызова (импорт модуля не трогает сеть и event loop), сохраняя
+    мемоизацию.
+    """
+    return AsyncOpenAI(
+        api_key=GROQ_API_KEY,
+        base_url=GROQ_BASE_URL,
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+            timeout=httpx.Timeout(60.0, connect=5.0)
+        )
+    )
+
+
+@atexit.register
+def _close_client():
+    """Закрывает пул соединений при завершении процесса."""
+    if not get_client.cache_info().currsize:
+        return
+    try:
+        asyncio.run(get_client().close())
+    except RuntimeError:
+        pass
+
+
+class _TokenBucketLimiter:
+    """Простой token-bucket лимитер запросов в минуту для asyncio."""
+
+    def __init__(self, max_rate: int, period: float = 60.0):
+        self.max_rate = max_rate
+        self.period = period
+        self._tokens = float(max_rate)
+        self._last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    float(self.max_rate),
+                    self._tokens + (now - self._last_refill) * self.max_rate / self.period
+                )
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * self.period / self.max_rate)
+
+
+_SEM = asyncio.Semaphore(int(os.getenv("LLM_MAX_CONCURRENCY", "6")))
+_LIMITER = _TokenBucketLimiter(int(os.getenv("LLM_MAX_RPM", "120")))
+
+
+async def _create_completion(**kwargs):
+    """Вызывает LLM под общим семафором и лимитером запросов.
+
+    Защищает endpoint от 429-ответов, когда несколько сессий
+    интервью выполняются конкурентно.
+    """
+    async with _SEM:
+        await _LIMITER.acquire()
+        return await get_client().chat.completions.create(**kwargs)
+
+
+async def _stream_completion(on_token=None, **kwargs) -> str:
+    """Вызывает LLM в режиме стриминга и собирает ответ по токенам.
+
+    Первый токен приходит через сотни миллисекунд вместо секунд
+    ожидания полного ответа; on_token позволяет UI показывать текст
+    по мере генерации.
+    """
+    parts = []
+    async with _SEM:
+        await _LIMITER.acquire()
+        stream = await get_client().chat.completions.create(stream=True, **kwargs)
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                if on_token is not None:
+                    on_token(delta)
+    return "".join(parts)
+
+
+@functools.lru_cache(maxsize=256)
+def _topics_for(role: str, difficulty_level: int, grade: str) -> tuple:
+    """Возвращает темы для роли/сложности с фолбэком на грейд.
+
+    Исходные данные статичны, поэтому лестница словарных фолбэков
+    вычисляется один раз на комбинацию аргументов.
+    """
+    topics = TOPICS_BY_ROLE_AND_DIFFICULTY.get(role, {}).get(difficulty_level)
+    if not topics:
+        topics = TOPICS_BY_ROLE_AND_GRADE.get(role, {}).get(
+            grade,
+            TOPICS_BY_GRADE.get(grade, TOPICS_BY_GRADE["Junior"])
+        )
+    return tuple(topics)
 
 
 class InterviewerAgent:
     """Агент-интервьюер, ведущий диалог с кандидатом."""
-    
+
     def __init__(self):
         self.name = "Interviewer_Agent"
         self.model = LLM_MODEL
         
-    def generate_question(self, state: InterviewState, mentor_rec: str = None) -> str:
-        """Генерирует вопрос или ответ интервьюера."""
+    async def generate_question(self, state: InterviewState, mentor_rec: str = None,
+                                on_token=None) -> str:
+        """Генерирует вопрос или ответ интервьюера.
+
+        Ответ стримится по токенам; on_token вызывается на каждый
+        фрагмент текста по мере генерации.
+        """
         cand = state["candidate"]
         turn = state["current_turn"]
 
         detected_role = detect_role_from_position(cand.get("position", ""), default="backend")
-        
-        sys_prompt = INTERVIEWER_SYSTEM_PROMPT.format(
+
+        difficulty_level = int(state.get("difficulty_level", 2) or 2)
+        difficulty_level = max(1, min(10, difficulty_level))
+
+        # Статический префикс идёт первым сообщением (кэшируется
+        # провайдером), динамический контекст хода — отдельным.
+        context_prompt = INTERVIEWER_CONTEXT_PROMPT.format(
             candidate_name=cand["name"],
             position=cand["position"],
             grade=cand["grade"],
             experience=cand["experience"],
-            turn_number=turn
+            turn_number=turn,
+            role_label=ROLE_LABELS.get(detected_role, detected_role),
+            difficulty_level=difficulty_level
         )
-        sys_prompt += f"\nПрофессиональная роль (определена системой): {ROLE_LABELS.get(detected_role, detected_role)}\n"
-        
-        difficulty_level = int(state.get("difficulty_level", 2) or 2)
-        difficulty_level = max(1, min(10, difficulty_level))
-        sys_prompt += f"Текущий уровень сложности (1-10): {difficulty_level}\n"
-        
-        msgs = [{"role": "system", "content": sys_prompt}]
 
-        recent_messages = state["messages"][-3:]
-        for msg in recent_messages:
-            message_role = "assistant" if msg.type == "ai" else "user"
-            msgs.append({"role": message_role, "content": msg.content})
-        
+        msgs = [
+            {"role": "system", "content": INTERVIEWER_SYSTEM_PROMPT},
+            {"role": "system", "content": context_prompt},
+            *(
+                {"role": "assistant" if msg.type == "ai" else "user", "content": msg.content}
+                for msg in state["messages"][-3:]
+            )
+        ]
+
+        tail = []
         if mentor_rec:
-            msgs.append({
+            tail.append({
                 "role": "system",
                 "content": f"[INTERNAL - MENTOR]: {mentor_rec}"
             })
-        
-        topics = TOPICS_BY_ROLE_AND_DIFFICULTY.get(detected_role, {}).get(difficulty_level)
-        if not topics:
-            topics = TOPICS_BY_ROLE_AND_GRADE.get(detected_role, {}).get(
-                cand["grade"],
-                TOPICS_BY_GRADE.get(cand["grade"], TOPICS_BY_GRADE["Junior"])
-            )
+
+        topics = _topics_for(detected_role, difficulty_level, cand["grade"])
         covered = state["topics_covered"]
         remaining = [t for t in topics if t not in covered]
-        
         if remaining and turn > 0:
-            msgs.append({
+            tail.append({
                 "role": "system",
                 "content": f"Available topics: {', '.join(remaining[:3])}"
             })
-        
-        resp = client.chat.completions.create(
+
+        if tail:
+            msgs.extend(tail)
+
+        return await _stream_completion(
+            on_token=on_token,
             model=self.model,
             messages=msgs,
             temperature=LLM_TEMPERATURE
         )
-        
-        return resp.choices[0].message.content
-    
-    def respond_to_question(self, state: InterviewState, question: str) -> str:
+
+    async def respond_to_question(self, state: InterviewState, question: str,
+                                  on_token=None) -> str:
         """Отвечает на вопрос кандидата."""
         cand = state["candidate"]
         
@@ -104,13 +243,12 @@ Question: {question}
 
 Answer and ask next technical question."""
         
-        resp = client.chat.completions.create(
+        return await _stream_completion(
+            on_token=on_token,
             model=self.model,
             messages=[{"role": "system", "content": sys_prompt}],
             temperature=LLM_TEMPERATURE
         )
-        
-        return resp.choices[0].message.content
 
 
 class MentorAgent:
@@ -120,42 +258,43 @@ class MentorAgent:
         self.name = "Mentor_Agent"
         self.model = LLM_MODEL
         
-    def analyze(self, state: InterviewState, user_msg: str) -> Dict[str, Any]:
+    async def analyze(self, state: InterviewState, user_msg: str) -> Dict[str, Any]:
         """Анализирует ответ кандидата и возвращает рекомендации."""
         cand = state["candidate"]
         
-        ctx = f"""
+        ctx_parts = [f"""
             Candidate info:
             - Name: {cand["name"]}
             - Position: {cand["position"]}
             - Grade: {cand["grade"]}
             - Experience: {cand["experience"]}
-            
+
             Dialog history:
-        """
+        """]
 
         recent_messages = state["messages"][-3:]
         for msg in recent_messages:
             role = "Interviewer" if msg.type == "ai" else "Candidate"
-            ctx += f"\n{role}: {msg.content}"
+            ctx_parts.append(f"\n{role}: {msg.content}")
 
-        ctx += f"\n\nLast response: {user_msg}"
+        ctx_parts.append(f"\n\nLast response: {user_msg}")
+        ctx = "".join(ctx_parts)
         
         msgs = [
             {"role": "system", "content": MENTOR_SYSTEM_PROMPT},
             {"role": "user", "content": ctx}
         ]
         
-        resp = client.chat.completions.create(
+        resp = await _create_completion(
             model=self.model,
             messages=msgs,
             temperature=0.3,
-            response_format={"type": "json_object"}
+            response_format=_MENTOR_RESPONSE_FORMAT
         )
-        
+
         try:
-            result = json.loads(resp.choices[0].message.content)
-        except json.JSONDecodeError:
+            result = _json_loads(resp.choices[0].message.content)
+        except ValueError:
             result = {
                 "analysis": "Failed to analyze",
                 "is_correct": None,
@@ -168,36 +307,54 @@ class MentorAgent:
         return result
 
 
+# Кэш результатов фактчекинга: проверка чистая относительно утверждения,
+# а одни и те же ложные факты ("Python 4.0" и т.п.) повторяются между
+# ходами и сессиями — повторный LLM round-trip не нужен.
+_FACT_CHECK_CACHE: Dict[str, Dict[str, Any]] = {}
+
+
+def _fact_cache_key(statement: str) -> str:
+    """Возвращает ключ кэша для нормализованного утверждения."""
+    normalized = " ".join(statement.lower().split())
+    return hashlib.blake2b(normalized.encode("utf-8")).hexdigest()
+
+
 class FactCheckerAgent:
     """Агент для проверки фактов в ответах кандидата."""
-    
+
     def __init__(self):
         self.name = "FactChecker_Agent"
         self.model = LLM_MODEL
-        
-    def check(self, statement: str) -> Dict[str, Any]:
+
+    async def check(self, statement: str) -> Dict[str, Any]:
         """Проверяет утверждение на достоверность."""
+        cache_key = _fact_cache_key(statement)
+        cached = _FACT_CHECK_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+
         prompt = FACT_CHECKER_PROMPT.format(statement=statement)
-        
-        resp = client.chat.completions.create(
+
+        resp = await _create_completion(
             model=self.model,
             messages=[
                 {"role": "system", "content": "You are an IT fact-checking expert."},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.1,
-            response_format={"type": "json_object"}
+            response_format=_FACTCHECK_RESPONSE_FORMAT
         )
-        
+
         try:
-            result = json.loads(resp.choices[0].message.content)
-        except json.JSONDecodeError:
+            result = _json_loads(resp.choices[0].message.content)
+            _FACT_CHECK_CACHE[cache_key] = result
+        except ValueError:
             result = {
                 "is_true": None,
                 "explanation": "Could not verify",
                 "correct_info": ""
             }
-        
+
         return result
 
 
@@ -208,22 +365,24 @@ class FeedbackGeneratorAgent:
         self.name = "FeedbackGenerator_Agent"
         self.model = LLM_MODEL
         
-    def generate(self, state: InterviewState) -> Dict[str, Any]:
+    async def generate(self, state: InterviewState) -> Dict[str, Any]:
         """Генерирует итоговый отчёт на основе истории интервью."""
         cand = state["candidate"]
         
-        history = ""
+        history_parts = []
         for turn in state["turns"]:
-            history += f"\n--- Turn {turn['turn_id']} ---"
-            history += f"\nInterviewer: {turn['agent_visible_message']}"
-            history += f"\nCandidate: {turn['user_message']}"
+            history_parts.append(f"\n--- Turn {turn['turn_id']} ---")
+            history_parts.append(f"\nInterviewer: {turn['agent_visible_message']}")
+            history_parts.append(f"\nCandidate: {turn['user_message']}")
             if turn.get('internal_thoughts'):
-                history += f"\n[Internal]: {turn['internal_thoughts']}"
-        
+                history_parts.append(f"\n[Internal]: {turn['internal_thoughts']}")
+
         if state["red_flags"]:
-            history += f"\n\n--- Issues found ---"
+            history_parts.append("\n\n--- Issues found ---")
             for flag in state["red_flags"]:
-                history += f"\n- {flag}"
+                history_parts.append(f"\n- {flag}")
+
+        history = "".join(history_parts)
         
         prompt = FEEDBACK_GENERATOR_PROMPT.format(
             interview_history=history,
@@ -233,19 +392,19 @@ class FeedbackGeneratorAgent:
             experience=cand["experience"]
         )
         
-        resp = client.chat.completions.create(
+        resp = await _create_completion(
             model=self.model,
             messages=[
-                {"role": "system", "content": "You are a candidate evaluation expert."},
+                {"role": "system", "content": FEEDBACK_GENERATOR_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.5,
-            response_format={"type": "json_object"}
+            response_format=_FEEDBACK_RESPONSE_FORMAT
         )
-        
+
         try:
-            result = json.loads(resp.choices[0].message.content)
-        except json.JSONDecodeError:
+            result = _json_loads(resp.choices[0].message.content)
+        except ValueError:
             result = {
                 "verdict": {
                     "grade": "Unknown",
@@ -253,7 +412,7 @@ class FeedbackGeneratorAgent:
                     "confidence_score": 0
                 },
                 "technical_review": {
-                    "confirmed_skills": state["confirmed_skills"],
+                    "confirmed_skills": sorted(state["confirmed_skills"]),
                     "knowledge_gaps": state["knowledge_gaps"]
                 },
                 "soft_skills": {
@@ -271,12 +430,29 @@ class FeedbackGeneratorAgent:
         
         return result
 
+    async def generate_batch(self, states: List[InterviewState]) -> List[Dict[str, Any]]:
+        """Генерирует отчёты для нескольких интервью конкурентно.
+
+        Предназначен для офлайн-переоценки пачки завершённых интервью:
+        вместо последовательных вызовов все отчёты запрашиваются через
+        asyncio.gather под общим семафором и лимитером LLM-вызовов.
+        """
+        return list(await asyncio.gather(*(self.generate(state) for state in states)))
+
+
+# Порядковый номер мыслей: монотонный счётчик вместо ISO-штампа на
+# каждую запись (см. InternalThought в state.py).
+_thought_seq = itertools.count(1)
+
 
-def create_thought(from_agent: str, to_agent: str, content: str) -> InternalThought:
+def create_thought(from_agent: str, to_agent: str, content: str,
+                   turn_id: int = 0) -> InternalThought:
     """Создаёт запись внутренней мысли агента."""
     return InternalThought(
         from_agent=from_agent,
         to_agent=to_agent,
         content=content,
-        timestamp=datetime.now().isoformat()
+        seq=next(_thought_seq),
+        ts=time.time(),
+        turn_id=turn_id
     )
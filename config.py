@@ -4,6 +4,7 @@
 Содержит настройки LLM, темы вопросов по грейдам
 и системные промпты для агентов.
 """
+import functools
 import os
 from typing import Dict, List, Optional
 
@@ -93,7 +94,9 @@ ROLE_KEYWORDS: Dict[str, List[str]] = {
 }
 
 
+@functools.lru_cache(maxsize=1024)
 def detect_role_from_position(position: str, default: str = "backend") -> str:
+    """Определяет роль по названию позиции (чистая функция, мемоизируется)."""
     pos = (position or "").lower()
     for role, keywords in ROLE_KEYWORDS.items():
         for kw in keywords:
@@ -505,6 +508,10 @@ TOPICS_BY_ROLE_AND_GRADE: Dict[str, Dict[str, List[str]]] = {
     }
 }
 
+# Статическая часть промпта интервьюера. Не содержит интерполяций —
+# байт-в-байт одинакова между ходами, чтобы провайдер мог кэшировать
+# префикс промпта. Переменные данные передаются отдельным сообщением
+# (INTERVIEWER_CONTEXT_PROMPT) после кэшируемого префикса.
 INTERVIEWER_SYSTEM_PROMPT = """Ты опытный технический интервьюер в IT-компании. Твоя задача — провести техническое собеседование с кандидатом.
 
 ВАЖНЫЕ ПРАВИЛА:
@@ -517,14 +524,17 @@ INTERVIEWER_SYSTEM_PROMPT = """Ты опытный технический инт
 7. НЕ соглашайся с явно неверными утверждениями кандидата
 8. Возвращай беседу к теме интервью, если кандидат уходит от темы
 9. НЕ задавай вопросы, ответы на которые кандидат уже дал ранее
+"""
 
-Информация о кандидате:
+INTERVIEWER_CONTEXT_PROMPT = """Информация о кандидате:
 - Имя: {candidate_name}
 - Позиция: {position}
 - Грейд: {grade}
 - Опыт: {experience}
 
 Текущий ход интервью: {turn_number}
+Профессиональная роль (определена системой): {role_label}
+Текущий уровень сложности (1-10): {difficulty_level}
 """
 
 MENTOR_SYSTEM_PROMPT = """Ты опытный ментор (Observer) на техническом интервью. Твоя задача — анализировать ответы кандидата и давать рекомендации интервьюеру.
@@ -616,19 +626,12 @@ FACT_CHECKER_PROMPT = """Ты эксперт по проверке фактов
 }}
 """
 
-FEEDBACK_GENERATOR_PROMPT = """Ты эксперт по оценке кандидатов на технических собеседованиях.
+# Статическая инструкция генератора отчёта (кэшируемый префикс) и
+# отдельный шаблон с данными конкретного интервью.
+FEEDBACK_GENERATOR_SYSTEM_PROMPT = """Ты эксперт по оценке кандидатов на технических собеседованиях.
 
 На основе истории интервью сгенерируй подробный структурированный отчет.
 
-История интервью:
-{interview_history}
-
-Информация о кандидате:
-- Имя: {candidate_name}
-- Позиция: {position}
-- Грейд: {grade}
-- Опыт: {experience}
-
 ВАЖНО ДЛЯ knowledge_gaps:
 - Для КАЖДОГО вопроса, на который кандидат ответил неправильно или не ответил, ОБЯЗАТЕЛЬНО укажи:
   - topic: тема вопроса
@@ -640,36 +643,159 @@ FEEDBACK_GENERATOR_PROMPT = """Ты эксперт по оценке канди
 - Например: "https://docs.python.org/3/tutorial/", "https://realpython.com/", "https://habr.com/ru/articles/"
 
 Сгенерируй отчет в следующем формате JSON:
-{{
-    "verdict": {{
+{
+    "verdict": {
         "grade": "Junior/Middle/Senior (фактический уровень на основе ответов)",
         "hiring_recommendation": "Hire/No Hire/Strong Hire",
         "confidence_score": 0-100
-    }},
-    "technical_review": {{
+    },
+    "technical_review": {
         "confirmed_skills": ["список подтвержденных навыков с пояснениями"],
         "knowledge_gaps": [
-            {{
+            {
                 "topic": "тема",
                 "question": "вопрос, на который кандидат не ответил",
                 "correct_answer": "ПОДРОБНЫЙ правильный ответ"
-            }}
+            }
         ]
-    }},
-    "soft_skills": {{
+    },
+    "soft_skills": {
         "clarity": "оценка ясности изложения (1-10)",
         "honesty": "оценка честности (1-10)",
         "engagement": "оценка вовлеченности (1-10)",
         "comments": "комментарии по soft skills"
-    }},
-    "roadmap": {{
+    },
+    "roadmap": {
         "topics_to_improve": ["список тем для изучения"],
         "resources": [
             "https://docs.python.org/3/tutorial/ - Официальный туториал Python",
             "https://realpython.com/ - Практические руководства",
             "другие конкретные ресурсы"
         ]
-    }},
+    },
     "summary": "Общее резюме по кандидату"
-}}
+}
 """
+
+FEEDBACK_GENERATOR_PROMPT = """История интервью:
+{interview_history}
+
+Информация о кандидате:
+- Имя: {candidate_name}
+- Позиция: {position}
+- Грейд: {grade}
+- Опыт: {experience}
+"""
+
+# JSON-схемы ответов агентов для response_format={"type": "json_schema"}.
+# Строгая схема гарантирует валидный JSON от модели, поэтому fallback-ветки
+# разбора (с потерей данных хода) становятся практически недостижимыми.
+MENTOR_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "analysis": {"type": "string"},
+        "is_correct": {"type": ["boolean", "null"]},
+        "correctness_score": {"type": "integer", "minimum": 0, "maximum": 100},
+        "confidence_level": {"type": "string", "enum": ["high", "medium", "low"]},
+        "red_flags": {"type": "array", "items": {"type": "string"}},
+        "is_hallucination": {"type": "boolean"},
+        "is_question_from_candidate": {"type": "boolean"},
+        "is_off_topic": {"type": "boolean"},
+        "topic_detected": {"type": "string"},
+        "difficulty_recommendation": {
+            "type": "string",
+            "enum": ["increase", "decrease", "maintain"]
+        },
+        "recommendation": {"type": "string"},
+        "suggested_action": {
+            "type": "string",
+            "enum": [
+                "ask_followup", "simplify", "move_on",
+                "challenge", "answer_question", "redirect_to_topic"
+            ]
+        }
+    },
+    "required": [
+        "analysis", "is_correct", "correctness_score", "confidence_level",
+        "red_flags", "is_hallucination", "is_question_from_candidate",
+        "is_off_topic", "topic_detected", "difficulty_recommendation",
+        "recommendation", "suggested_action"
+    ],
+    "additionalProperties": False
+}
+
+FACTCHECK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "is_true": {"type": ["boolean", "null"]},
+        "explanation": {"type": "string"},
+        "correct_info": {"type": "string"}
+    },
+    "required": ["is_true", "explanation", "correct_info"],
+    "additionalProperties": False
+}
+
+FEEDBACK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "verdict": {
+            "type": "object",
+            "properties": {
+                "grade": {"type": "string"},
+                "hiring_recommendation": {
+                    "type": "string",
+                    "enum": ["Hire", "No Hire", "Strong Hire"]
+                },
+                "confidence_score": {"type": "integer", "minimum": 0, "maximum": 100}
+            },
+            "required": ["grade", "hiring_recommendation", "confidence_score"],
+            "additionalProperties": False
+        },
+        "technical_review": {
+            "type": "object",
+            "properties": {
+                "confirmed_skills": {"type": "array", "items": {"type": "string"}},
+                "knowledge_gaps": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "topic": {"type": "string"},
+                            "question": {"type": "string"},
+                            "correct_answer": {"type": "string"}
+                        },
+                        "required": ["topic", "question", "correct_answer"],
+                        "additionalProperties": False
+                    }
+                }
+            },
+            "required": ["confirmed_skills", "knowledge_gaps"],
+            "additionalProperties": False
+        },
+        "soft_skills": {
+            "type": "object",
+            "properties": {
+                "clarity": {"type": "integer", "minimum": 1, "maximum": 10},
+                "honesty": {"type": "integer", "minimum": 1, "maximum": 10},
+                "engagement": {"type": "integer", "minimum": 1, "maximum": 10},
+                "comments": {"type": "string"}
+            },
+            "required": ["clarity", "honesty", "engagement", "comments"],
+            "additionalProperties": False
+        },
+        "roadmap": {
+            "type": "object",
+            "properties": {
+                "topics_to_improve": {"type": "array", "items": {"type": "string"}},
+                "resources": {"type": "array", "items": {"type": "string"}}
+            },
+            "required": ["topics_to_improve", "resources"],
+            "additionalProperties": False
+        },
+        "summary": {"type": "string"}
+    },
+    "required": [
+        "verdict", "technical_review", "soft_skills", "roadmap", "summary"
+    ],
+    "additionalProperties": False
+}
@@ -3,8 +3,11 @@
 
 Определяет узлы графа и логику переходов между агентами.
 """
+import asyncio
+import functools
 import json
-from typing import Literal, Dict, Any
+import re
+from typing import Literal, Dict, Any, List
 from datetime import datetime
 
 from langgraph.graph import StateGraph, END
@@ -21,21 +24,31 @@ from agents.agents import (
 from config import MAX_TURNS
 
 
+# Предкомпилированные шаблоны для горячего пути: один проход DFA вместо
+# вложенных подстрочных сканов на каждый флаг/сообщение.
+_HALLUCINATION_HINT_RE = re.compile(
+    "галлю|hallucin|ложн|false fact|factually", re.IGNORECASE
+)
+_STOP_COMMAND_RE = re.compile("стоп|stop|завершить|фидбэк|feedback")
+
+# Шаблонные ответы, для которых менторский анализ не даёт сигнала.
+_TRIVIAL_ANSWERS = {"да", "нет", "не знаю", "i don't know", "idk"}
+
 interviewer = InterviewerAgent()
 mentor = MentorAgent()
 fact_checker = FactCheckerAgent()
 feedback_generator = FeedbackGeneratorAgent()
 
 
-def interviewer_node(state: InterviewState) -> Dict[str, Any]:
+async def interviewer_node(state: InterviewState) -> Dict[str, Any]:
     """Узел интервьюера: генерирует вопрос или ответ для кандидата."""
     mentor_recommendation = None
     if state["internal_thoughts"]:
         last_thought = state["internal_thoughts"][-1]
         if last_thought["to_agent"] == "Interviewer_Agent":
             mentor_recommendation = last_thought["content"]
-    
-    response = interviewer.generate_question(state, mentor_recommendation)
+
+    response = await interviewer.generate_question(state, mentor_recommendation)
     new_message = AIMessage(content=response)
     
     return {
@@ -43,14 +56,33 @@ def interviewer_node(state: InterviewState) -> Dict[str, Any]:
     }
 
 
-def mentor_node(state: InterviewState) -> Dict[str, Any]:
+async def mentor_node(state: InterviewState) -> Dict[str, Any]:
     """Узел ментора: анализирует ответ кандидата и даёт рекомендации."""
-    user_messages = [m for m in state["messages"] if isinstance(m, HumanMessage)]
-    if not user_messages:
+    last_user_message = _last_user_message(state)
+    msg = last_user_message.strip()
+    if not msg:
         return {}
-    
-    last_user_message = user_messages[-1].content
-    analysis = mentor.analyze(state, last_user_message)
+
+    fact_task = None
+    if len(msg) < 12 or msg.lower() in _TRIVIAL_ANSWERS:
+        # Односложные и шаблонные ответы ("да", "не знаю") не содержат
+        # ничего для анализа — синтезируем результат без LLM-вызовов.
+        analysis = {
+            "analysis": "Неинформативный ответ",
+            "is_correct": False,
+            "confidence_level": "low",
+            "correctness_score": 20,
+            "recommendation": "Задай более конкретный уточняющий вопрос",
+            "suggested_action": "ask_followup"
+        }
+    else:
+        # Спекулятивно запускаем фактчекер параллельно с анализом ментора:
+        # оба вызова сетевые, и для нетривиальных ответов это убирает один
+        # последовательный round-trip. Если анализ покажет, что проверка
+        # не нужна, результат просто отбрасывается.
+        analysis_task = asyncio.create_task(mentor.analyze(state, last_user_message))
+        fact_task = asyncio.create_task(fact_checker.check(last_user_message))
+        analysis = await analysis_task
 
     difficulty_mode = (state.get("difficulty_mode") or "adaptive").lower()
     difficulty_level = int(state.get("difficulty_level", 2) or 2)
@@ -58,19 +90,23 @@ def mentor_node(state: InterviewState) -> Dict[str, Any]:
     correct_streak = int(state.get("correct_streak", 0) or 0)
     difficulty_history = list(state.get("difficulty_history") or [difficulty_level])
     
-    red_flags = []
-    mentor_flags = analysis.get("red_flags") or []
-    confidence_level = str(analysis.get("confidence_level") or "").lower()
-    correctness_score = analysis.get("correctness_score")
+    # Все нужные поля анализа читаются из словаря ровно один раз;
+    # дальше код работает только с локальными переменными.
+    analysis_text = analysis.get("analysis", "")
     is_correct = analysis.get("is_correct")
+    correctness_score = analysis.get("correctness_score")
+    confidence_level = str(analysis.get("confidence_level") or "").lower()
+    mentor_flags = analysis.get("red_flags") or []
     is_hallucination = bool(analysis.get("is_hallucination"))
+    difficulty_recommendation = (analysis.get("difficulty_recommendation") or "maintain").lower()
+    recommendation = analysis.get("recommendation", "Продолжить интервью")
+    suggested_action = analysis.get("suggested_action")
+    topic_detected = (analysis.get("topic_detected") or "").strip()
 
-    has_hallucination_hint = False
-    for flag in mentor_flags:
-        flag_lower = str(flag).lower()
-        if any(token in flag_lower for token in ["галлю", "hallucin", "ложн", "false fact", "factually"]):
-            has_hallucination_hint = True
-            break
+    red_flags = []
+    has_hallucination_hint = any(
+        _HALLUCINATION_HINT_RE.search(str(flag)) for flag in mentor_flags
+    )
 
     is_high_confidence = confidence_level in {"high", "высок", "высокий", "высокая"}
     is_low_score = isinstance(correctness_score, (int, float)) and correctness_score <= 40
@@ -83,73 +119,85 @@ def mentor_node(state: InterviewState) -> Dict[str, Any]:
         or "python 4" in last_user_message.lower()
     )
 
-    if should_fact_check:
-        fact_result = fact_checker.check(last_user_message)
-        if fact_result.get("is_true") is False:
-            explanation = fact_result.get("explanation", "")
-            correct_info = fact_result.get("correct_info", "")
-            red_flags.append(
-                f"ГАЛЛЮЦИНАЦИЯ/ЛОЖНЫЙ ФАКТ: {explanation}. Правильная информация: {correct_info}".strip()
-            )
-
-            thought = create_thought(
-                from_agent="FactChecker_Agent",
-                to_agent="Interviewer_Agent",
-                content=f"ALERT: Кандидат уверенно сообщает ложные факты. {explanation}. "
-                        f"Правильная информация: {correct_info}. "
-                        f"Это критическая ошибка знаний. Пометь как 'red flag'."
-            )
-            state["internal_thoughts"].append(thought)
-
-    topics_covered = list(state.get("topics_covered") or [])
-    topic_detected = (analysis.get("topic_detected") or "").strip()
-    if topic_detected and topic_detected not in topics_covered:
-        topics_covered.append(topic_detected)
+    if should_fact_check and fact_task is not None:
+        # Дополнительно проверяем фактические утверждения из red_flags
+        # ментора; все проверки независимы и выполняются конкурентно.
+        extra_statements = [
+            str(flag) for flag in mentor_flags
+            if _HALLUCINATION_HINT_RE.search(str(flag))
+        ]
+        fact_results = await asyncio.gather(
+            fact_task,
+            *(fact_checker.check(statement) for statement in extra_statements),
+            return_exceptions=True
+        )
+        for fact_result in fact_results:
+            if isinstance(fact_result, BaseException):
+                continue
+            if fact_result.get("is_true") is False:
+                explanation = fact_result.get("explanation", "")
+                correct_info = fact_result.get("correct_info", "")
+                red_flags.append(
+                    f"ГАЛЛЮЦИНАЦИЯ/ЛОЖНЫЙ ФАКТ: {explanation}. Правильная информация: {correct_info}".strip()
+                )
+
+                thought = create_thought(
+                    from_agent="FactChecker_Agent",
+                    to_agent="Interviewer_Agent",
+                    content=f"ALERT: Кандидат уверенно сообщает ложные факты. {explanation}. "
+                            f"Правильная информация: {correct_info}. "
+                            f"Это критическая ошибка знаний. Пометь как 'red flag'.",
+                    turn_id=state.get("current_turn", 0)
+                )
+                state["internal_thoughts"].append(thought)
+    elif fact_task is not None:
+        fact_task.cancel()
+
+    topics_covered = set(state.get("topics_covered") or ())
+    if topic_detected:
+        topics_covered.add(topic_detected)
 
     if difficulty_mode == "adaptive":
         old_difficulty = difficulty_level
-        correctness_score = analysis.get("correctness_score")
-        is_correct = analysis.get("is_correct")
-        recommendation = (analysis.get("difficulty_recommendation") or "maintain").lower()
 
         if is_correct is True and isinstance(correctness_score, (int, float)) and correctness_score >= 80:
             correct_streak += 1
         else:
             correct_streak = 0
 
-        if recommendation == "increase" or correct_streak >= 2:
+        if difficulty_recommendation == "increase" or correct_streak >= 2:
             difficulty_level = min(10, difficulty_level + 1)
             correct_streak = 0
-        elif recommendation == "decrease":
+        elif difficulty_recommendation == "decrease":
             difficulty_level = max(1, difficulty_level - 1)
         elif isinstance(correctness_score, (int, float)) and correctness_score <= 40:
             difficulty_level = max(1, difficulty_level - 1)
 
         if difficulty_level != old_difficulty:
             difficulty_history.append(difficulty_level)
-    
-    recommendation = analysis.get("recommendation", "Продолжить интервью")
-    if analysis.get("suggested_action") == "challenge" or red_flags:
+
+    if suggested_action == "challenge" or red_flags:
         recommendation = f"ВАЖНО: Кандидат допустил ошибку. {recommendation}. Вежливо укажи на неточность."
     
     thought = create_thought(
         from_agent="Mentor_Agent",
         to_agent="Interviewer_Agent",
-        content=f"Анализ: {analysis.get('analysis', '')}. "
-                f"Уровень уверенности: {analysis.get('confidence_level', 'unknown')}. "
-                f"Рекомендация: {recommendation}"
+        content=f"Анализ: {analysis_text}. "
+                f"Уровень уверенности: {confidence_level or 'unknown'}. "
+                f"Рекомендация: {recommendation}",
+        turn_id=state.get("current_turn", 0)
     )
-    
-    confirmed_skills = list(state["confirmed_skills"])
+
+    confirmed_skills = set(state["confirmed_skills"])
     knowledge_gaps = list(state["knowledge_gaps"])
-    
-    if analysis.get("is_correct"):
-        topic = analysis.get("analysis", "")[:50]
-        if topic and topic not in confirmed_skills:
-            confirmed_skills.append(topic)
-    elif analysis.get("is_correct") is False:
+
+    if is_correct:
+        topic = analysis_text[:50]
+        if topic:
+            confirmed_skills.add(topic)
+    elif is_correct is False:
         gap = {
-            "topic": analysis.get("analysis", "")[:50],
+            "topic": analysis_text[:50],
             "question": "",
             "correct_answer": ""
         }
@@ -168,11 +216,11 @@ def mentor_node(state: InterviewState) -> Dict[str, Any]:
     }
 
 
-def feedback_node(state: InterviewState) -> Dict[str, Any]:
+async def feedback_node(state: InterviewState) -> Dict[str, Any]:
     """Узел генерации итогового отчёта."""
-    feedback = feedback_generator.generate(state)
+    feedback = await feedback_generator.generate(state)
     
-    report = f"""
+    parts = [f"""
 **ИТОГОВЫЙ ОТЧЕТ ПО ИНТЕРВЬЮ**
 
 **Кандидат:** {state['candidate']['name']}
@@ -193,20 +241,20 @@ def feedback_node(state: InterviewState) -> Dict[str, Any]:
 ## Технический обзор
 
 ### Подтвержденные навыки:
-"""
+"""]
     for skill in feedback['technical_review']['confirmed_skills']:
-        report += f"- {skill}\n"
-    
-    report += "\n### Пробелы в знаниях:\n"
+        parts.append(f"- {skill}\n")
+
+    parts.append("\n### Пробелы в знаниях:\n")
     for gap in feedback['technical_review']['knowledge_gaps']:
         if isinstance(gap, dict):
-            report += f"- **{gap.get('topic', 'N/A')}**\n"
+            parts.append(f"- **{gap.get('topic', 'N/A')}**\n")
             if gap.get('correct_answer'):
-                report += f"  - Правильный ответ: {gap['correct_answer']}\n"
+                parts.append(f"  - Правильный ответ: {gap['correct_answer']}\n")
         else:
-            report += f"- {gap}\n"
-    
-    report += f"""
+            parts.append(f"- {gap}\n")
+
+    parts.append(f"""
 ---
 
 ## Soft Skills
@@ -224,22 +272,24 @@ def feedback_node(state: InterviewState) -> Dict[str, Any]:
 ## Рекомендации по развитию
 
 ### Темы для изучения:
-"""
+""")
     for topic in feedback['roadmap']['topics_to_improve']:
-        report += f"- {topic}\n"
-    
-    report += "\n### Рекомендуемые ресурсы:\n"
+        parts.append(f"- {topic}\n")
+
+    parts.append("\n### Рекомендуемые ресурсы:\n")
     for resource in feedback['roadmap']['resources']:
-        report += f"- {resource}\n"
-    
-    report += f"""
+        parts.append(f"- {resource}\n")
+
+    parts.append(f"""
 ---
 
 ## Резюме
 
 {feedback['summary']}
-"""
-    
+""")
+
+    report = "".join(parts)
+
     new_message = AIMessage(content=report)
     
     return {
@@ -254,11 +304,9 @@ def should_continue(state: InterviewState) -> Literal["mentor", "feedback", "end
     if state["interview_finished"]:
         return "end"
     
-    user_messages = [m for m in state["messages"] if isinstance(m, HumanMessage)]
-    if user_messages:
-        last_message = user_messages[-1].content.lower()
-        if any(cmd in last_message for cmd in ["стоп", "stop", "завершить", "фидбэк", "feedback"]):
-            return "feedback"
+    last_message = _last_user_message(state)
+    if last_message and _STOP_COMMAND_RE.search(last_message.lower()):
+        return "feedback"
     
     if state["current_turn"] >= MAX_TURNS:
         return "feedback"
@@ -266,6 +314,18 @@ def should_continue(state: InterviewState) -> Literal["mentor", "feedback", "end
     return "mentor"
 
 
+def _last_user_message(state: InterviewState) -> str:
+    """Возвращает текст последнего сообщения кандидата или пустую строку.
+
+    Идёт по истории с конца, поэтому в типичном случае (последнее
+    сообщение — от кандидата) не сканирует весь список.
+    """
+    for message in reversed(state["messages"]):
+        if isinstance(message, HumanMessage):
+            return message.content
+    return ""
+
+
 def should_interview(state: InterviewState) -> Literal["interviewer", "end"]:
     """Определяет, продолжать ли интервью после анализа ментора."""
     if state["interview_finished"]:
@@ -273,8 +333,14 @@ def should_interview(state: InterviewState) -> Literal["interviewer", "end"]:
     return "interviewer"
 
 
+@functools.lru_cache(maxsize=1)
 def create_interview_graph() -> StateGraph:
-    """Создаёт и компилирует граф для проведения интервью."""
+    """Создаёт и компилирует граф для проведения интервью.
+
+    Скомпилированный граф не зависит от состояния сессии, поэтому
+    результат кэшируется: повторные вызовы (новая сессия, новый
+    InterviewCoach) не перепроходят валидацию узлов и рёбер.
+    """
     workflow = StateGraph(InterviewState)
     
     workflow.add_node("interviewer", interviewer_node)
@@ -303,5 +369,19 @@ def create_interview_graph() -> StateGraph:
     )
     
     workflow.add_edge("feedback", END)
-    
+
     return workflow.compile()
+
+
+async def run_sessions(initial_states: List[InterviewState]) -> List[InterviewState]:
+    """Прогоняет несколько сессий интервью конкурентно в одном event loop.
+
+    Полезно для пакетных прогонов (например, сравнение вариантов
+    промптов на N мок-интервью): сессии продвигаются параллельно,
+    а суммарную нагрузку на LLM endpoint ограничивают общий семафор
+    и лимитер запросов из agents.agents.
+    """
+    graph = create_interview_graph()
+    return list(await asyncio.gather(
+        *(graph.ainvoke(state) for state in initial_states)
+    ))
@@ -2,16 +2,43 @@
 Мультиагентная система для проведения технических интервью.
 """
 
+import asyncio
+import hashlib
+import logging
 import os
 import json
+import random
 import re
 import sys
-import time
-from datetime import datetime
-from typing import Dict, Any, List, Optional
+from collections import deque
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Deque, Dict, Any, Final, List, Optional
 from dataclasses import dataclass, field
-from openai import OpenAI
+
+import httpx
+from openai import AsyncOpenAI
+
 from log_adapter import LogAdapter
+from utils import llm_cache
+
+# orjson (C-реализация) декодирует типичный ответ LLM в разы быстрее
+# stdlib json; зависимость необязательная. orjson.JSONDecodeError —
+# подкласс ValueError, как и json.JSONDecodeError.
+try:
+    import orjson
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj: Any, pretty: bool = False) -> str:
+        option = orjson.OPT_INDENT_2 if pretty else 0
+        return orjson.dumps(obj, option=option).decode()
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj: Any, pretty: bool = False) -> str:
+        return json.dumps(obj, ensure_ascii=False, indent=2 if pretty else None)
+
+logger = logging.getLogger(__name__)
 
 from config import (
     GROQ_API_KEY,
@@ -22,42 +49,173 @@ from config import (
     detect_role_from_position,
 )
 
-client = OpenAI(
+# HTTP/2 мультиплексирует параллельные вызовы (ментор + фактчекер +
+# интервьюер) по одному TCP-соединению; требует опционального пакета h2.
+try:
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+# Общий клиент с ограниченным пулом keep-alive соединений: агенты
+# переиспользуют TCP/TLS-сессии вместо рукопожатия на каждый вызов,
+# а лимит не даёт asyncio.gather раздуть число соединений к endpoint.
+client = AsyncOpenAI(
     api_key=GROQ_API_KEY,
-    base_url=GROQ_BASE_URL
+    base_url=GROQ_BASE_URL,
+    http_client=httpx.AsyncClient(
+        http2=_HTTP2_AVAILABLE,
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=16),
+        timeout=httpx.Timeout(60.0, connect=5.0)
+    )
 )
 
+# Признаки утверждений, которые имеет смысл спекулятивно отправить
+# фактчекеру параллельно с анализом ментора: упоминания версий и чисел.
+_VERSION_HINT_RE = re.compile(r"python|\d")
+
+# Шаблоны очистки markdown-обёрток вокруг JSON, скомпилированные один
+# раз: extract_json вызывается 2-3 раза за ход.
+_RE_JSON_FENCE_OPEN = re.compile(r'^```json\s*')
+_RE_FENCE_OPEN = re.compile(r'^```\s*')
+_RE_FENCE_CLOSE = re.compile(r'\s*```$')
+
+_JSON_DECODER = json.JSONDecoder()
+
+# Отображение ролей истории в подписи для промптов.
+_ROLE_LABEL = {"assistant": "Интервьюер", "user": "Кандидат"}
+
+# Сколько последних сообщений истории попадает в промпт интервьюера
+# дословно; более ранние ходы заменяются сводкой затронутых тем.
+_HISTORY_WINDOW = 8
+
+# Жёсткая граница хранимой истории: в промпты уходит только хвост,
+# полная хронология фиксируется в turns и NDJSON-журнале, поэтому
+# держать реплики старше 50 в памяти незачем.
+_HISTORY_MAXLEN = 50
 
-def call_llm(prompt: str, temperature: float = 0.7) -> str:
-    """Вызывает LLM и возвращает текст ответа."""
-    resp = client.chat.completions.create(
+
+def _tail(seq, n: int):
+    """Последние n элементов последовательности без среза (deque)."""
+    return islice(seq, max(0, len(seq) - n), None)
+
+
+async def call_llm(prompt: str, temperature: float = 0.7, system: str = None) -> str:
+    """Вызывает LLM и возвращает текст ответа.
+
+    system — статический префикс, передаваемый отдельным system-сообщением:
+    байт-в-байт одинаковый между ходами, он попадает в prefix-кэш
+    провайдера и не перетокенизируется на каждый вызов.
+    """
+    cache_key = llm_cache.make_key(LLM_MODEL, temperature, system, prompt)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    messages = [{"role": "system", "content": system}] if system else []
+    messages.append({"role": "user", "content": prompt})
+    resp = await client.chat.completions.create(
         model=LLM_MODEL,
-        messages=[{"role": "user", "content": prompt}],
+        messages=messages,
         temperature=temperature
     )
-    return resp.choices[0].message.content
+    text = resp.choices[0].message.content
+    llm_cache.put(cache_key, text)
+    return text
+
+
+async def call_llm_stream(prompt: str, temperature: float = 0.7,
+                          system: str = None, on_token=None) -> str:
+    """Вызывает LLM в режиме стриминга и собирает ответ по токенам.
+
+    Первый токен приходит через сотни миллисекунд вместо секунд
+    ожидания полного ответа; on_token вызывается на каждый фрагмент
+    текста, что позволяет печатать ответ по мере генерации.
+    """
+    cache_key = llm_cache.make_key(LLM_MODEL, temperature, system, prompt)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        # Попадание в кэш: ответ отдаётся одним фрагментом.
+        if on_token is not None:
+            on_token(cached)
+        return cached
+
+    messages = [{"role": "system", "content": system}] if system else []
+    messages.append({"role": "user", "content": prompt})
+    parts = []
+    stream = await client.chat.completions.create(
+        model=LLM_MODEL,
+        messages=messages,
+        temperature=temperature,
+        stream=True
+    )
+    async for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            parts.append(delta)
+            if on_token is not None:
+                on_token(delta)
+    text = "".join(parts)
+    llm_cache.put(cache_key, text)
+    return text
+
+
+async def call_llm_batch(prompts: List[tuple]) -> List[str]:
+    """Выполняет несколько независимых LLM-вызовов конкурентно.
+
+    prompts — список пар (prompt, temperature). Ответы возвращаются
+    в исходном порядке; латентность пачки равна максимальному, а не
+    суммарному времени вызовов.
+    """
+    return list(await asyncio.gather(
+        *(call_llm(prompt, temperature) for prompt, temperature in prompts)
+    ))
 
 
 def extract_json(text: str) -> Dict:
-    """Извлекает JSON из текста, даже если он обёрнут в markdown."""
-    text = re.sub(r'^```json\s*', '', text.strip())
-    text = re.sub(r'^```\s*', '', text)
-    text = re.sub(r'\s*```$', '', text)
+    """Извлекает JSON из текста, даже если он обёрнут в markdown.
 
-    json_match = re.search(r'\{[\s\S]*\}', text)
-    if json_match:
+    Сканирует текст линейно через raw_decode от каждой открывающей
+    скобки и возвращает первый валидный объект — без жадного
+    регулярного выражения, захватывающего крайние скобки вместе
+    с мусором между объектами.
+    """
+    text = text.strip()
+
+    # Быстрый путь: дисциплинированный ответ («начни сразу с {») — это
+    # целиком JSON-объект, зачистка fence-обёрток ему не нужна.
+    if text.startswith('{') and text.endswith('}'):
         try:
-            return json.loads(json_match.group())
-        except:
+            return _json_loads(text)
+        except ValueError:
             pass
-    
-    try:
-        return json.loads(text)
-    except:
-        return {}
+
+    text = _RE_JSON_FENCE_OPEN.sub('', text)
+    text = _RE_FENCE_OPEN.sub('', text)
+    text = _RE_FENCE_CLOSE.sub('', text)
+
+    start = text.find('{')
+    while start != -1:
+        try:
+            obj, _ = _JSON_DECODER.raw_decode(text, start)
+            return obj
+        except json.JSONDecodeError:
+            start = text.find('{', start + 1)
+
+    return {}
+
+
+def _retry_delay(attempt: int) -> float:
+    """Экспоненциальная пауза со случайным джиттером.
+
+    Фиксированный интервал синхронизирует параллельные ретраи в
+    «стадо» на общем rate limit; джиттер их рассинхронизирует.
+    """
+    return min(8.0, 0.5 * (2 ** attempt)) + random.uniform(0, 0.25)
 
 
-def call_llm_with_json_retry(prompt: str, max_retries: int = 3, temperature: float = 0.7) -> Dict:
+async def call_llm_with_json_retry(prompt: str, max_retries: int = 3,
+                                   temperature: float = 0.7, system: str = None) -> Dict:
     """
     Retry логика для получения валидного JSON.
     
@@ -77,9 +235,9 @@ def call_llm_with_json_retry(prompt: str, max_retries: int = 3, temperature: flo
 - НЕ используй ```json или другие обёртки
 - Начни ответ сразу с открывающей фигурной скобки {{
 """
-                resp = call_llm(retry_prompt, current_temp)
+                resp = await call_llm(retry_prompt, current_temp, system=system)
             else:
-                resp = call_llm(prompt, current_temp)
+                resp = await call_llm(prompt, current_temp, system=system)
             
             result = extract_json(resp)
             
@@ -87,26 +245,70 @@ def call_llm_with_json_retry(prompt: str, max_retries: int = 3, temperature: flo
                 return result
 
             if attempt < max_retries - 1:
-                time.sleep(0.5)
-                
+                await asyncio.sleep(_retry_delay(attempt))
+
         except Exception as e:
-            print(f"[DEBUG] Ошибка при вызове LLM (попытка {attempt + 1}): {e}")
+            # Ленивая %s-подстановка: при выключенном DEBUG строка
+            # не форматируется и syscall записи не выполняется.
+            logger.debug("Ошибка при вызове LLM (попытка %d): %s", attempt + 1, e)
             if attempt < max_retries - 1:
-                time.sleep(1)
+                await asyncio.sleep(_retry_delay(attempt))
     
     return {}
 
 
-@dataclass
+# Статический префикс интервьюера: не содержит данных хода и передаётся
+# system-сообщением, чтобы кэшироваться на стороне провайдера.
+_INTERVIEWER_SYSTEM_STATIC = """Ты опытный технический интервьюер в IT-компании. Проводишь собеседование.
+
+ПРАВИЛА:
+1. Задавай по ОДНОМУ техническому вопросу за раз
+2. Вопрос должен соответствовать текущему уровню сложности
+3. Если кандидат задает встречный вопрос - ОБЯЗАТЕЛЬНО ответь на него кратко и профессионально, затем продолжи интервью
+4. НЕ соглашайся с явно неверными утверждениями
+5. Если кандидат говорит что-то странное про Python 4.0 или другие несуществующие технологии - вежливо укажи на ошибку и дай правильную информацию
+6. Будь профессионален и дружелюбен
+7. Если кандидат уходит от темы интервью - вежливо верни беседу к техническим вопросам
+8. НЕ задавай вопросы по темам, которые уже были затронуты
+9. При ответе "не знаю" - кратко объясни правильный ответ и перейди к другой теме
+"""
+
+# Стартовая сложность по грейду; порядок важен — "junior+" должен
+# проверяться раньше "junior".
+_GRADE_TO_DIFFICULTY = (
+    ("senior", 8),
+    ("middle", 6),
+    ("junior+", 5),
+    ("junior plus", 5),
+    ("junior", 3),
+)
+
+_DIFFICULTY_DESC = {
+    1: "НАЧАЛЬНЫЙ (основы программирования)",
+    2: "БАЗОВЫЙ (структуры данных)",
+    3: "JUNIOR- (базовый Python)",
+    4: "JUNIOR (функции и исключения)",
+    5: "JUNIOR+ (ООП)",
+    6: "MIDDLE- (продвинутый Python)",
+    7: "MIDDLE (асинхронность и API)",
+    8: "MIDDLE+ (архитектура кода)",
+    9: "SENIOR- (инфраструктура)",
+    10: "SENIOR (системный дизайн)"
+}
+
+
+@dataclass(slots=True, frozen=True)
 class InternalThought:
     """Внутренняя мысль агента, невидимая для кандидата."""
     from_agent: str
     to_agent: str
     content: str
-    timestamp: str = field(default_factory=lambda: datetime.now().isoformat())
+    timestamp: str = field(
+        default_factory=lambda: datetime.now(timezone.utc).isoformat()
+    )
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Turn:
     """Один ход диалога интервью."""
     turn_id: int
@@ -117,46 +319,40 @@ class Turn:
 
 class InterviewerAgent:
     """Агент-интервьюер, ведущий диалог с кандидатом."""
-    
+
+    # Таблица статична — атрибут класса, а не поле каждого экземпляра.
+    topics_by_difficulty = {
+        1: ["что такое переменная", "базовые типы данных (int, str, bool)", "print и input"],
+        2: ["списки и кортежи", "словари", "условные операторы if/else"],
+        3: ["циклы for и while", "функции и return", "работа со строками"],
+        4: ["аргументы функций (*args, **kwargs)", "обработка исключений try/except", "работа с файлами"],
+        5: ["ООП: классы и объекты", "наследование", "инкапсуляция и полиморфизм"],
+        6: ["декораторы", "генераторы и итераторы", "контекстные менеджеры"],
+        7: ["многопоточность (threading)", "асинхронность async/await", "работа с API"],
+        8: ["паттерны проектирования", "SOLID принципы", "тестирование (pytest, unittest)"],
+        9: ["архитектура приложений", "микросервисы", "Docker и контейнеризация"],
+        10: ["распределённые системы", "масштабирование и оптимизация", "системный дизайн"]
+    }
+
     def __init__(self):
         self.name = "Interviewer"
 
-        self.topics_by_difficulty = {
-            1: ["что такое переменная", "базовые типы данных (int, str, bool)", "print и input"],
-            2: ["списки и кортежи", "словари", "условные операторы if/else"],
-            3: ["циклы for и while", "функции и return", "работа со строками"],
-            4: ["аргументы функций (*args, **kwargs)", "обработка исключений try/except", "работа с файлами"],
-            5: ["ООП: классы и объекты", "наследование", "инкапсуляция и полиморфизм"],
-            6: ["декораторы", "генераторы и итераторы", "контекстные менеджеры"],
-            7: ["многопоточность (threading)", "асинхронность async/await", "работа с API"],
-            8: ["паттерны проектирования", "SOLID принципы", "тестирование (pytest, unittest)"],
-            9: ["архитектура приложений", "микросервисы", "Docker и контейнеризация"],
-            10: ["распределённые системы", "масштабирование и оптимизация", "системный дизайн"]
-        }
-    
-    def generate_response(self, cand: Dict[str, str], history: List[Dict], 
-                         mentor_advice: str = "", turn: int = 0,
-                         difficulty: int = 2, correct_streak: int = 0,
-                         topics_covered: List[str] = None,
-                         edge_case: str = None) -> str:
-        
-        role = detect_role_from_position(cand.get("position", ""), default="backend")
-        role_topics_map = TOPICS_BY_ROLE_AND_DIFFICULTY.get(role, {})
+    async def generate_response(self, cand: Dict[str, str], history: List[Dict],
+                                mentor_advice: str = "", turn: int = 0,
+                                difficulty: int = 2, correct_streak: int = 0,
+                                topics_covered: List[str] = None,
+                                edge_case: str = None, on_token=None,
+                                role: str = None, role_topics_map: Dict = None,
+                                history_formatted: List[str] = None) -> str:
+
+        # Роль и карта тем фиксированы для всего интервью — координатор
+        # резолвит их один раз в start() и передаёт сюда готовыми.
+        if role is None:
+            role = detect_role_from_position(cand.get("position", ""), default="backend")
+        if role_topics_map is None:
+            role_topics_map = TOPICS_BY_ROLE_AND_DIFFICULTY.get(role, {})
         topics = role_topics_map.get(difficulty) or self.topics_by_difficulty.get(difficulty, self.topics_by_difficulty[2])
 
-        difficulty_desc = {
-            1: "НАЧАЛЬНЫЙ (основы программирования)",
-            2: "БАЗОВЫЙ (структуры данных)",
-            3: "JUNIOR- (базовый Python)",
-            4: "JUNIOR (функции и исключения)",
-            5: "JUNIOR+ (ООП)",
-            6: "MIDDLE- (продвинутый Python)",
-            7: "MIDDLE (асинхронность и API)",
-            8: "MIDDLE+ (архитектура кода)",
-            9: "SENIOR- (инфраструктура)",
-            10: "SENIOR (системный дизайн)"
-        }
-        
         topics_info = ""
         if topics_covered:
             topics_info = f"""
@@ -198,9 +394,7 @@ class InterviewerAgent:
 - Скажи что-то вроде: "Интересная точка зрения. Давайте вернёмся к техническому вопросу..."
 """
         
-        prompt = f"""Ты опытный технический интервьюер в IT-компании. Проводишь собеседование.
-
-ИНФОРМАЦИЯ О КАНДИДАТЕ:
+        prompt = f"""ИНФОРМАЦИЯ О КАНДИДАТЕ:
 - Имя: {cand['name']}
 - Позиция: {cand['position']}
 - Грейд: {cand['grade']}
@@ -208,50 +402,92 @@ class InterviewerAgent:
 
  ПРОФЕССИОНАЛЬНАЯ РОЛЬ (определена системой): {ROLE_LABELS.get(role, role)}
 
-ТЕКУЩИЙ УРОВЕНЬ СЛОЖНОСТИ: {difficulty}/10 ({difficulty_desc.get(difficulty, 'N/A')})
+ТЕКУЩИЙ УРОВЕНЬ СЛОЖНОСТИ: {difficulty}/10 ({_DIFFICULTY_DESC.get(difficulty, 'N/A')})
 ПРАВИЛЬНЫХ ОТВЕТОВ ПОДРЯД: {correct_streak}
 
 ТЕМЫ ДЛЯ ВОПРОСОВ НА ЭТОМ УРОВНЕ: {', '.join(topics)}
 {topics_info}
 {edge_case_instruction}
 
-ПРАВИЛА:
-1. Задавай по ОДНОМУ техническому вопросу за раз
-2. Вопрос должен соответствовать текущему уровню сложности ({difficulty}/10)
-3. Если кандидат задает встречный вопрос - ОБЯЗАТЕЛЬНО ответь на него кратко и профессионально, затем продолжи интервью
-4. НЕ соглашайся с явно неверными утверждениями
-5. Если кандидат говорит что-то странное про Python 4.0 или другие несуществующие технологии - вежливо укажи на ошибку и дай правильную информацию
-6. Будь профессионален и дружелюбен
-7. Если кандидат уходит от темы интервью - вежливо верни беседу к техническим вопросам
-8. НЕ задавай вопросы по темам, которые уже были затронуты
-9. При ответе "не знаю" - кратко объясни правильный ответ и перейди к другой теме
-
 ТЕКУЩИЙ ХОД: {turn}
 """
-        
+
+        # Сборка через список + join: конкатенация строк в цикле была бы
+        # O(N^2) по мере роста истории.
+        parts = [prompt]
         if mentor_advice:
-            prompt += f"\n[ВНУТРЕННЯЯ РЕКОМЕНДАЦИЯ ОТ OBSERVER]: {mentor_advice}"
-        
-        prompt += "\n\nИСТОРИЯ ДИАЛОГА:\n"
-        for h in history:
-            role = "Интервьюер" if h["role"] == "assistant" else "Кандидат"
-            prompt += f"{role}: {h['content']}\n"
-        
-        prompt += "\nТвой ответ как интервьюера:"
-        
-        return call_llm(prompt)
+            parts.append(f"\n[ВНУТРЕННЯЯ РЕКОМЕНДАЦИЯ ОТ OBSERVER]: {mentor_advice}")
+
+        # Полная история раздувает промпт линейно с числом ходов, а всё
+        # важное из ранних ходов уже отражено в topics_covered: в промпт
+        # идёт хвост истории плюс однострочная сводка.
+        parts.append("\n\nИСТОРИЯ ДИАЛОГА:\n")
+        if len(history) > _HISTORY_WINDOW and topics_covered:
+            parts.append(f"[Ранее обсуждались темы: {', '.join(topics_covered)}]\n")
+        # Координатор передаёт готовые строки из скользящего буфера —
+        # история append-only, и переформатировать её каждый ход незачем.
+        if history_formatted is not None:
+            parts.extend(_tail(history_formatted, _HISTORY_WINDOW))
+        else:
+            # _tail вместо среза: history может быть deque, а deque
+            # не поддерживает слайсы.
+            for h in _tail(history, _HISTORY_WINDOW):
+                parts.append(f"{_ROLE_LABEL[h['role']]}: {h['content']}\n")
 
+        parts.append("\nТвой ответ как интервьюера:")
+        prompt = "".join(parts)
 
-class MentorAgent:
-    """
-    Агент-ментор (Observer), анализирующий ответы кандидата в реальном времени.
-    Работает "за кулисами", невидимо для кандидата.
-    """
-    
-    def __init__(self):
-        self.name = "Observer"
+        return await call_llm_stream(
+            prompt, system=_INTERVIEWER_SYSTEM_STATIC, on_token=on_token
+        )
+
+
+# Статические части промпта ментора: преамбула и спецификация формата.
+# Вместе с few-shot примерами они собираются в один system-префикс,
+# байт-в-байт одинаковый между ходами (prefix-кэш провайдера).
+_MENTOR_PREAMBLE = """Ты опытный ментор (Observer), анализирующий ответы кандидата на техническом интервью.
+Ты работаешь "за кулисами" и даёшь рекомендации интервьюеру.
+"""
 
-        self.few_shot_examples = """
+_MENTOR_FORMAT_SPEC = """
+Теперь проанализируй следующий ответ кандидата и верни ТОЛЬКО JSON (без markdown, без ```):
+
+ФОРМАТ ОТВЕТА:
+{
+    "analysis": "краткий анализ ответа (2-3 предложения)",
+    "is_correct": true или false или null,
+    "correctness_score": число от 0 до 100,
+    "confidence_level": "high" или "medium" или "low",
+    "red_flags": ["список проблем, если есть"],
+    "is_hallucination": true или false,
+    "hallucination_details": "описание галлюцинации, если есть",
+    "is_question_from_candidate": true или false,
+    "is_off_topic": true или false,
+    "is_dont_know": true или false,
+    "is_silence": true или false,
+    "is_rude": true или false,
+    "topic_detected": "тема, которую затронул кандидат",
+    "difficulty_recommendation": "increase" или "decrease" или "maintain",
+    "recommendation": "рекомендация для интервьюера",
+    "suggested_action": "ask_followup" или "simplify" или "challenge" или "answer_question" или "continue" или "redirect_to_topic"
+}
+
+КРИТЕРИИ:
+- is_dont_know: true если кандидат сказал "не знаю", "не помню", "не сталкивался"
+- is_silence: true если ответ пустой или очень короткий без смысла
+- is_rude: true если кандидат грубит или ведёт себя непрофессионально
+- correctness_score >= 80 И confidence_level == "high" → difficulty_recommendation: "increase"
+- correctness_score < 50 ИЛИ confidence_level == "low" → difficulty_recommendation: "decrease"
+
+ВАЖНО:
+- Python 4.0 НЕ СУЩЕСТВУЕТ — это всегда галлюцинация
+- Верни ТОЛЬКО JSON, начни сразу с {
+"""
+
+
+# Few-shot примеры статичны: литерал парсится один раз на модуль,
+# а не при каждом создании MentorAgent.
+_MENTOR_FEW_SHOT_EXAMPLES: Final[str] = """
 ПРИМЕРЫ АНАЛИЗА:
 
 Пример 1 - Хороший ответ:
@@ -351,66 +587,52 @@ class MentorAgent:
     "suggested_action": "simplify"
 }
 """
-    
-    def analyze(self, user_msg: str, history: List[Dict], 
-                current_difficulty: int, topics_covered: List[str] = None) -> Dict[str, Any]:
-        """
-        Анализирует ответ кандидата с использованием few-shot примеров.
-        """
-        
-        topics_info = ""
-        if topics_covered:
-            topics_info = f"\nУЖЕ ЗАТРОНУТЫЕ ТЕМЫ: {', '.join(topics_covered)}"
-        
-        prompt = f"""Ты опытный ментор (Observer), анализирующий ответы кандидата на техническом интервью.
-Ты работаешь "за кулисами" и даёшь рекомендации интервьюеру.
 
-ТЕКУЩИЙ УРОВЕНЬ СЛОЖНОСТИ ВОПРОСОВ: {current_difficulty}/10
-{topics_info}
+# Полный system-префикс ментора: преамбула + few-shot + спецификация
+# формата. Собирается один раз и байт-в-байт одинаков между ходами.
+_MENTOR_SYSTEM_PROMPT: Final[str] = (
+    _MENTOR_PREAMBLE + _MENTOR_FEW_SHOT_EXAMPLES + _MENTOR_FORMAT_SPEC
+)
 
-{self.few_shot_examples}
 
-Теперь проанализируй следующий ответ кандидата и верни ТОЛЬКО JSON (без markdown, без ```):
+class MentorAgent:
+    """
+    Агент-ментор (Observer), анализирующий ответы кандидата в реальном времени.
+    Работает "за кулисами", невидимо для кандидата.
+    """
 
-ФОРМАТ ОТВЕТА:
-{{
-    "analysis": "краткий анализ ответа (2-3 предложения)",
-    "is_correct": true или false или null,
-    "correctness_score": число от 0 до 100,
-    "confidence_level": "high" или "medium" или "low",
-    "red_flags": ["список проблем, если есть"],
-    "is_hallucination": true или false,
-    "hallucination_details": "описание галлюцинации, если есть",
-    "is_question_from_candidate": true или false,
-    "is_off_topic": true или false,
-    "is_dont_know": true или false,
-    "is_silence": true или false,
-    "is_rude": true или false,
-    "topic_detected": "тема, которую затронул кандидат",
-    "difficulty_recommendation": "increase" или "decrease" или "maintain",
-    "recommendation": "рекомендация для интервьюера",
-    "suggested_action": "ask_followup" или "simplify" или "challenge" или "answer_question" или "continue" или "redirect_to_topic"
-}}
+    def __init__(self):
+        self.name = "Observer"
+        self.few_shot_examples = _MENTOR_FEW_SHOT_EXAMPLES
+        self.system_prompt = _MENTOR_SYSTEM_PROMPT
 
-КРИТЕРИИ:
-- is_dont_know: true если кандидат сказал "не знаю", "не помню", "не сталкивался"
-- is_silence: true если ответ пустой или очень короткий без смысла
-- is_rude: true если кандидат грубит или ведёт себя непрофессионально
-- correctness_score >= 80 И confidence_level == "high" → difficulty_recommendation: "increase"
-- correctness_score < 50 ИЛИ confidence_level == "low" → difficulty_recommendation: "decrease"
+    async def analyze(self, user_msg: str, history: List[Dict],
+                      current_difficulty: int, topics_covered: List[str] = None,
+                      history_formatted: List[str] = None) -> Dict[str, Any]:
+        """
+        Анализирует ответ кандидата с использованием few-shot примеров.
+        """
 
-ВАЖНО: 
-- Python 4.0 НЕ СУЩЕСТВУЕТ — это всегда галлюцинация
-- Верни ТОЛЬКО JSON, начни сразу с {{
-"""
-        
-        ctx = "\nИстория диалога:\n"
-        for h in history[-4:]:
-            role = "Интервьюер" if h["role"] == "assistant" else "Кандидат"
-            ctx += f"{role}: {h['content']}\n"
-        ctx += f"\nПоследний ответ кандидата: {user_msg}"
+        topics_info = ""
+        if topics_covered:
+            topics_info = f"\nУЖЕ ЗАТРОНУТЫЕ ТЕМЫ: {', '.join(topics_covered)}"
 
-        result = call_llm_with_json_retry(prompt + ctx, max_retries=3, temperature=0.5)
+        ctx_parts = [
+            f"ТЕКУЩИЙ УРОВЕНЬ СЛОЖНОСТИ ВОПРОСОВ: {current_difficulty}/10\n{topics_info}\n\nИстория диалога:\n"
+        ]
+        if history_formatted is not None:
+            ctx_parts.extend(_tail(history_formatted, 4))
+        else:
+            # _tail вместо среза: history может быть deque, а deque
+            # не поддерживает слайсы.
+            for h in _tail(history, 4):
+                ctx_parts.append(f"{_ROLE_LABEL[h['role']]}: {h['content']}\n")
+        ctx_parts.append(f"\nПоследний ответ кандидата: {user_msg}")
+        ctx = "".join(ctx_parts)
+
+        result = await call_llm_with_json_retry(
+            ctx, max_retries=3, temperature=0.5, system=self.system_prompt
+        )
         
         if not result:
             result = {
@@ -433,15 +655,115 @@ class MentorAgent:
         return result
 
 
+# Спецификация формата комбинированного анализатора: тот же JSON, что
+# у ментора, плюс встроенный результат проверки фактов.
+_COMBINED_FORMAT_SPEC: Final[str] = _MENTOR_FORMAT_SPEC.replace(
+    '"redirect_to_topic"\n}',
+    '"redirect_to_topic",\n'
+    '    "fact_check": {"is_true": true или false или null, '
+    '"explanation": "объяснение ошибки", '
+    '"correct_info": "правильная информация"} или null\n'
+    '}'
+) + """
+ДОПОЛНИТЕЛЬНО:
+- fact_check заполняй только при is_hallucination: true, иначе null
+- В fact_check указывай, что именно неверно и как на самом деле
+"""
+
+_COMBINED_SYSTEM_PROMPT: Final[str] = (
+    _MENTOR_PREAMBLE + _MENTOR_FEW_SHOT_EXAMPLES + _COMBINED_FORMAT_SPEC
+)
+
+
+class CombinedAnalyzerAgent(MentorAgent):
+    """Анализатор, совмещающий ментора и фактчекера в одном вызове.
+
+    На ходах с галлюцинациями экономит полный сетевой round-trip:
+    проверка фактов возвращается в том же JSON, что и анализ.
+    Раздельные агенты остаются доступны через --multi-agent.
+    """
+
+    def __init__(self):
+        self.name = "CombinedAnalyzer"
+        self.few_shot_examples = _MENTOR_FEW_SHOT_EXAMPLES
+        self.system_prompt = _COMBINED_SYSTEM_PROMPT
+
+
+# Таблицы фраз для определения edge case, поднятые на уровень модуля,
+# и их скомпилированные альтернации: одно DFA-сканирование сообщения
+# вместо прохода по каждой фразе на каждый вызов.
+_DONT_KNOW_PHRASES = (
+    "не знаю", "не помню", "не сталкивался", "не уверен",
+    "затрудняюсь", "не могу ответить", "пропустить", "skip",
+    "не изучал", "не работал с этим", "не приходилось"
+)
+_RUDE_PHRASES = (
+    "отстань", "достал", "надоел", "глупый вопрос", "тупой",
+    "идиот", "дурак", "пошёл", "отвали", "заткнись"
+)
+# Готовые рекомендации интервьюеру для каждого edge case: таблица
+# вместо цепочки elif в process и единое место для правки текстов.
+_EDGE_ADVICE = {
+    "dont_know": "Кандидат признал незнание. Похвали за честность, КРАТКО объясни правильный ответ и перейди к более простой теме.",
+    "silence": "Кандидат молчит или дал пустой ответ. Подбодри его и переформулируй вопрос проще.",
+    "rude": "Кандидат ведёт себя непрофессионально. Сохраняй спокойствие, напомни о формате интервью.",
+    "troll": "Кандидат даёт несерьёзные ответы. Игнорируй и задай следующий вопрос.",
+}
+
+_TROLL_INDICATORS = frozenset({
+    "42", "потому что", "а зачем", "не скажу", "угадай",
+    "секрет", "магия", "потому что гладиолус"
+})
+
+_DONT_KNOW_RE = re.compile("|".join(map(re.escape, _DONT_KNOW_PHRASES)))
+_RUDE_RE = re.compile("|".join(map(re.escape, _RUDE_PHRASES)))
+
+
+# Кэш результатов фактчекинга: проверка чистая относительно утверждения,
+# а одни и те же ложные факты повторяются между ходами и сессиями.
+_fact_cache: Dict[str, Dict[str, Any]] = {}
+
+# Заранее известные ложные утверждения — те же факты, что захардкожены
+# в промпте фактчекера. Совпадение по подстроке закрывает самые частые
+# галлюцинации вообще без LLM-вызова.
+_KNOWN_FALSE_FACTS = (
+    ("python 4", {
+        "is_true": False,
+        "explanation": "Python 4.0 не существует. Последняя стабильная версия — Python 3.x (3.12, 3.13).",
+        "correct_info": "Актуальные версии Python — 3.x; релиз Python 4.0 не анонсирован и не планируется."
+    }),
+    ("циклы for уберут", {
+        "is_true": False,
+        "explanation": "Циклы for никуда не денутся из Python — это базовая конструкция языка.",
+        "correct_info": "Циклы for остаются частью Python; никаких планов по их удалению нет."
+    }),
+    ("gil полностью убран", {
+        "is_true": False,
+        "explanation": "GIL (Global Interpreter Lock) всё ещё существует в CPython.",
+        "correct_info": "GIL присутствует в CPython; работа над его опциональным отключением идёт в рамках PEP 703."
+    }),
+)
+
+
 class FactCheckerAgent:
     """Агент для проверки фактов в ответах кандидата."""
-    
+
     def __init__(self):
         self.name = "FactChecker"
-    
-    def check(self, stmt: str) -> Dict[str, Any]:
+
+    async def check(self, stmt: str) -> Dict[str, Any]:
         """Проверяет утверждение на достоверность."""
-        
+
+        stmt_lower = stmt.lower().strip()
+        for pattern, known in _KNOWN_FALSE_FACTS:
+            if pattern in stmt_lower:
+                return known
+
+        cache_key = hashlib.sha256(stmt_lower.encode()).hexdigest()
+        cached = _fact_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         prompt = f"""Ты эксперт по проверке фактов в области программирования и IT.
 
 Проверь следующее утверждение кандидата:
@@ -460,118 +782,133 @@ class FactCheckerAgent:
 }}
 """
         
-        result = call_llm_with_json_retry(prompt, max_retries=3, temperature=0.3)
-        
-        if not result:
+        result = await call_llm_with_json_retry(prompt, max_retries=3, temperature=0.3)
+
+        if result:
+            _fact_cache[cache_key] = result
+        else:
             result = {
                 "is_true": False,
                 "explanation": "Не удалось проверить утверждение",
                 "correct_info": ""
             }
-        
-        return result
 
+        return result
 
-class FeedbackGeneratorAgent:
-    """Агент для генерации итогового отчёта по интервью."""
-    
-    def __init__(self):
-        self.name = "FeedbackGenerator"
-    
-    def generate(self, history: List[Dict], thoughts: List[InternalThought],
-                 candidate: Dict[str, str], difficulty_history: List[int],
-                 questions_asked: List[Dict] = None) -> Dict[str, Any]:
-        """Генерирует структурированный отчёт по интервью."""
-        
-        hist_str = ""
-        for h in history:
-            role = "Интервьюер" if h["role"] == "assistant" else "Кандидат"
-            hist_str += f"{role}: {h['content']}\n"
-        
-        thoughts_str = ""
-        for t in thoughts:
-            thoughts_str += f"[{t.from_agent} -> {t.to_agent}]: {t.content}\n"
 
-        questions_info = ""
-        if questions_asked:
-            failed_questions = [q for q in questions_asked if q.get("is_correct") == False or q.get("correctness_score", 100) < 50]
-            if failed_questions:
-                questions_info = "\n\nВОПРОСЫ, НА КОТОРЫЕ КАНДИДАТ ОТВЕТИЛ НЕПРАВИЛЬНО:\n"
-                for q in failed_questions:
-                    questions_info += f"- Вопрос: {q.get('question', 'N/A')}\n  Ответ кандидата: {q.get('answer', 'N/A')}\n  Оценка: {q.get('correctness_score', 0)}%\n\n"
-        
-        avg_difficulty = sum(difficulty_history) / len(difficulty_history) if difficulty_history else 0
-        max_difficulty = max(difficulty_history) if difficulty_history else 0
-        
-        prompt = f"""Ты эксперт по оценке кандидатов на технических собеседованиях.
+# Статическая часть промпта генератора отчёта: роль, инструкции и
+# спецификация JSON. Уходит отдельным system-сообщением, байт-в-байт
+# одинаковым между вызовами (prefix-кэш провайдера); динамика —
+# история, мысли, кандидат, статистика — остаётся в user-сообщении.
+_FEEDBACK_SYSTEM_STATIC: Final[str] = """Ты эксперт по оценке кандидатов на технических собеседованиях.
 
 На основе истории интервью сгенерируй подробный структурированный отчёт.
 
-ИСТОРИЯ ДИАЛОГА:
-{hist_str}
-
-ВНУТРЕННИЕ МЫСЛИ АГЕНТОВ:
-{thoughts_str}
-{questions_info}
-
-ИНФОРМАЦИЯ О КАНДИДАТЕ:
-- Имя: {candidate.get('name', 'Unknown')}
-- Позиция: {candidate.get('position', 'Unknown')}
-- Заявленный грейд: {candidate.get('grade', 'Unknown')}
-- Опыт: {candidate.get('experience', 'Unknown')}
-
-СТАТИСТИКА СЛОЖНОСТИ:
-- Средний уровень: {avg_difficulty:.1f}/10
-- Максимальный уровень: {max_difficulty}/10
-- История: {difficulty_history}
-
 ВАЖНЫЕ ИНСТРУКЦИИ:
 1. В knowledge_gaps для КАЖДОГО неправильного ответа укажи ПОДРОБНЫЙ правильный ответ
 2. В resources укажи КОНКРЕТНЫЕ URL (docs.python.org, realpython.com, habr.com)
 3. Оценивай реальный уровень кандидата, а не заявленный
 
 Верни ТОЛЬКО JSON (без markdown, без ```):
-{{
-    "verdict": {{
+{
+    "verdict": {
         "grade": "Junior/Middle/Senior (реальный уровень)",
         "hiring_recommendation": "Strong Hire/Hire/No Hire",
         "confidence_score": число от 0 до 100
-    }},
-    "technical_review": {{
+    },
+    "technical_review": {
         "confirmed_skills": ["навык 1 с пояснением", "навык 2 с пояснением"],
         "knowledge_gaps": [
-            {{
+            {
                 "topic": "тема",
                 "question": "вопрос",
                 "candidate_answer": "что ответил кандидат",
                 "correct_answer": "ПОДРОБНЫЙ правильный ответ (3-5 предложений)"
-            }}
+            }
         ]
-    }},
-    "soft_skills": {{
+    },
+    "soft_skills": {
         "clarity": число от 1 до 10,
         "honesty": число от 1 до 10,
         "engagement": число от 1 до 10,
         "comments": "комментарии"
-    }},
-    "roadmap": {{
+    },
+    "roadmap": {
         "topics_to_improve": ["тема 1", "тема 2"],
         "resources": [
             "https://docs.python.org/3/tutorial/ - Официальный туториал Python",
             "https://realpython.com/python-basics/ - Основы Python",
             "конкретные ссылки по темам"
         ]
-    }},
-    "difficulty_analysis": {{
-        "average_level": {avg_difficulty:.1f},
-        "max_reached": {max_difficulty},
+    },
+    "difficulty_analysis": {
+        "average_level": средний уровень из статистики сложности,
+        "max_reached": максимальный уровень из статистики сложности,
         "progression": "описание как менялась сложность"
-    }},
+    },
     "summary": "общее резюме (3-5 предложений)"
-}}
+}
+"""
+
+
+class FeedbackGeneratorAgent:
+    """Агент для генерации итогового отчёта по интервью."""
+
+    def __init__(self):
+        self.name = "FeedbackGenerator"
+    
+    async def generate(self, history: List[Dict], thoughts: List[InternalThought],
+                       candidate: Dict[str, str], difficulty_history: List[int],
+                       questions_asked: List[Dict] = None,
+                       history_formatted: List[str] = None) -> Dict[str, Any]:
+        """Генерирует структурированный отчёт по интервью."""
+
+        if history_formatted is not None:
+            hist_str = "".join(history_formatted)
+        else:
+            hist_str = "".join(
+                f"{_ROLE_LABEL[h['role']]}: {h['content']}\n" for h in history
+            )
+
+        thoughts_str = "".join(
+            f"[{t.from_agent} -> {t.to_agent}]: {t.content}\n" for t in thoughts
+        )
+
+        questions_info = ""
+        if questions_asked:
+            failed_questions = [q for q in questions_asked if q.get("is_correct") == False or q.get("correctness_score", 100) < 50]
+            if failed_questions:
+                questions_info = "\n\nВОПРОСЫ, НА КОТОРЫЕ КАНДИДАТ ОТВЕТИЛ НЕПРАВИЛЬНО:\n" + "".join(
+                    f"- Вопрос: {q.get('question', 'N/A')}\n  Ответ кандидата: {q.get('answer', 'N/A')}\n  Оценка: {q.get('correctness_score', 0)}%\n\n"
+                    for q in failed_questions
+                )
+        
+        avg_difficulty = sum(difficulty_history) / len(difficulty_history) if difficulty_history else 0
+        max_difficulty = max(difficulty_history) if difficulty_history else 0
+        
+        prompt = f"""ИСТОРИЯ ДИАЛОГА:
+{hist_str}
+
+ВНУТРЕННИЕ МЫСЛИ АГЕНТОВ:
+{thoughts_str}
+{questions_info}
+
+ИНФОРМАЦИЯ О КАНДИДАТЕ:
+- Имя: {candidate.get('name', 'Unknown')}
+- Позиция: {candidate.get('position', 'Unknown')}
+- Заявленный грейд: {candidate.get('grade', 'Unknown')}
+- Опыт: {candidate.get('experience', 'Unknown')}
+
+СТАТИСТИКА СЛОЖНОСТИ:
+- Средний уровень: {avg_difficulty:.1f}/10
+- Максимальный уровень: {max_difficulty}/10
+- История: {difficulty_history}
 """
 
-        result = call_llm_with_json_retry(prompt, max_retries=3, temperature=0.5)
+        result = await call_llm_with_json_retry(
+            prompt, max_retries=3, temperature=0.5,
+            system=_FEEDBACK_SYSTEM_STATIC
+        )
         
         if not result:
             result = {
@@ -607,28 +944,74 @@ class MultiAgentInterviewCoach:
     состоянием интервью.
     """
     
-    def __init__(self, team_name: str = "Multi-Agent Interview Coach"):
+    def __init__(self, team_name: str = "Multi-Agent Interview Coach",
+                 pretty: bool = False, multi_agent: bool = False):
         self.team_name = team_name
+        # Логи потребляются программно; отступы в JSON — только по
+        # явному запросу (--pretty), без них сериализация заметно быстрее.
+        self.pretty = pretty
+        # По умолчанию анализ хода выполняется одним вызовом
+        # CombinedAnalyzer; --multi-agent возвращает раздельную пару
+        # ментор + фактчекер для A/B-сравнения.
+        self.multi_agent = multi_agent
         self.interviewer = InterviewerAgent()
         self.mentor = MentorAgent()
+        self.analyzer = CombinedAnalyzerAgent()
         self.fact_checker = FactCheckerAgent()
         self.feedback_gen = FeedbackGeneratorAgent()
         
         self.candidate: Dict[str, str] = {}
-        self.history: List[Dict] = []
+        # Ограниченная история: O(1) добавление и потолок памяти;
+        # полная хронология живёт в turns и NDJSON-журнале.
+        self.history: Deque[Dict] = deque(maxlen=_HISTORY_MAXLEN)
+        # Скользящий буфер готовых строк промпта: по одной на реплику,
+        # форматирование выполняется ровно один раз при добавлении.
+        self._history_formatted: Deque[str] = deque(maxlen=_HISTORY_MAXLEN)
         self.turns: List[Dict] = []
         self.thoughts: List[InternalThought] = []
         self.red_flags: List[str] = []
         self.turn_num = 0
         self.finished = False
+        # Последняя реплика интервьюера, поддерживается в _push_history:
+        # без хрупкой арифметики индексов вида history[-3].
+        self.last_assistant_msg = ""
         
         self.difficulty = 2
         self.correct_streak = 0
         self.difficulty_history: List[int] = []
         self.topics_covered: List[str] = []
         self.questions_asked: List[Dict] = []
-    
-    def start(self, name: str, position: str, grade: str, exp: str) -> str:
+
+        self._role: str = "backend"
+        self._role_topics_map: Dict = {}
+        self._feedback_task: Optional[asyncio.Task] = None
+
+        # Инкрементальный NDJSON-журнал: каждый ход дописывается O(1)
+        # байтами по мере интервью, вместо перезаписи всего лога.
+        # Заодно ходы не теряются при аварийном завершении.
+        self._ndjson_path: Optional[str] = None
+        self._ndjson_fp = None
+
+        # Каталоги, существование которых уже обеспечено: makedirs с
+        # его stat-сисколлами выполняется один раз на каталог, а не
+        # при каждом сохранении.
+        self._ready_dirs: set = set()
+
+    def _ensure_dir(self, dirname: str) -> None:
+        """Создаёт каталог один раз; повторные вызовы бесплатны."""
+        if dirname and dirname not in self._ready_dirs:
+            os.makedirs(dirname, exist_ok=True)
+            self._ready_dirs.add(dirname)
+
+    def _push_history(self, role: str, content: str) -> None:
+        """Добавляет реплику в историю вместе с готовой строкой промпта."""
+        self.history.append({"role": role, "content": content})
+        self._history_formatted.append(f"{_ROLE_LABEL[role]}: {content}\n")
+        if role == "assistant":
+            self.last_assistant_msg = content
+
+    async def start(self, name: str, position: str, grade: str, exp: str,
+                    on_token=None) -> str:
         """Инициализирует интервью и возвращает первое сообщение интервьюера."""
         
         self.candidate = {
@@ -639,26 +1022,33 @@ class MultiAgentInterviewCoach:
         }
 
         grade_lower = grade.lower()
-        if "senior" in grade_lower:
-            self.difficulty = 8
-        elif "middle" in grade_lower:
-            self.difficulty = 6
-        elif "junior+" in grade_lower or "junior plus" in grade_lower:
-            self.difficulty = 5
-        elif "junior" in grade_lower:
-            self.difficulty = 3
+        for key, level in _GRADE_TO_DIFFICULTY:
+            if key in grade_lower:
+                self.difficulty = level
+                break
         else:
             self.difficulty = 2
         
         self.difficulty_history.append(self.difficulty)
-        
-        resp = self.interviewer.generate_response(
-            self.candidate, [], "", 0, 
+
+        self._ensure_dir("logs")
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self._ndjson_path = f"logs/interview_turns_{ts}.ndjson"
+        self._ndjson_fp = open(self._ndjson_path, "a", encoding="utf-8")
+
+        # Позиция кандидата не меняется в течение интервью — роль и карта
+        # тем резолвятся один раз, а не на каждый ход.
+        self._role = detect_role_from_position(position, default="backend")
+        self._role_topics_map = TOPICS_BY_ROLE_AND_DIFFICULTY.get(self._role, {})
+
+        resp = await self.interviewer.generate_response(
+            self.candidate, [], "", 0,
             self.difficulty, self.correct_streak,
-            self.topics_covered
+            self.topics_covered, on_token=on_token,
+            role=self._role, role_topics_map=self._role_topics_map
         )
-        self.history.append({"role": "assistant", "content": resp})
-        
+        self._push_history("assistant", resp)
+
         return resp
 
     def _adjust_difficulty(self, analysis: Dict[str, Any]):
@@ -671,12 +1061,15 @@ class MultiAgentInterviewCoach:
         else:
             self.correct_streak = 0
 
+        # Политика в виде дельты с одним клиппированным присваиванием.
+        delta = 0
         if is_correct and (recommendation == "increase" or self.correct_streak >= 2):
-            self.difficulty = min(10, self.difficulty + 1)
+            delta = 1
             self.correct_streak = 0
         elif recommendation == "decrease" or (not is_correct and correctness < 40):
-            self.difficulty = max(1, self.difficulty - 1)
+            delta = -1
 
+        self.difficulty = min(10, max(1, self.difficulty + delta))
         self.difficulty_history.append(self.difficulty)
 
     
@@ -689,47 +1082,72 @@ class MultiAgentInterviewCoach:
         if len(msg_lower) < 3 or msg_lower in [".", "...", "-", "—"]:
             return "silence"
 
-        dont_know_phrases = [
-            "не знаю", "не помню", "не сталкивался", "не уверен",
-            "затрудняюсь", "не могу ответить", "пропустить", "skip",
-            "не изучал", "не работал с этим", "не приходилось"
-        ]
-        if any(phrase in msg_lower for phrase in dont_know_phrases) or analysis.get("is_dont_know"):
+        if _DONT_KNOW_RE.search(msg_lower) or analysis.get("is_dont_know"):
             return "dont_know"
 
-        rude_phrases = [
-            "отстань", "достал", "надоел", "глупый вопрос", "тупой",
-            "идиот", "дурак", "пошёл", "отвали", "заткнись"
-        ]
-        if any(phrase in msg_lower for phrase in rude_phrases) or analysis.get("is_rude"):
+        if _RUDE_RE.search(msg_lower) or analysis.get("is_rude"):
             return "rude"
 
-        troll_indicators = [
-            "42", "потому что", "а зачем", "не скажу", "угадай",
-            "секрет", "магия", "потому что гладиолус"
-        ]
-        if msg_lower in troll_indicators or (len(msg_lower) < 10 and "?" in msg_lower):
+        if msg_lower in _TROLL_INDICATORS or (len(msg_lower) < 10 and "?" in msg_lower):
             if analysis.get("correctness_score", 50) < 10 and not analysis.get("is_question_from_candidate"):
                 return "troll"
         
         return None
     
-    def process(self, user_msg: str) -> str:
+    async def process(self, user_msg: str, on_token=None,
+                      defer_feedback: bool = False) -> str:
         """
         Обрабатывает ответ кандидата.
-        
+
         Выполняет анализ через MentorAgent (Observer), проверку фактов через
         FactCheckerAgent при необходимости, и генерирует ответ
         интервьюера.
+
+        При defer_feedback=True команда завершения не блокирует вызов на
+        самом тяжёлом промпте системы: отчёт генерируется фоновой задачей
+        (забрать через get_feedback() в том же event loop), а кандидату
+        сразу возвращается подтверждение.
         """
-        
+
         self.turn_num += 1
-        self.history.append({"role": "user", "content": user_msg})
-        
-        if any(cmd in user_msg.lower() for cmd in ["стоп", "stop", "фидбэк", "feedback"]):
-            return self._gen_feedback()
+        # Один UTC-штамп на весь ход: мысли и запись хода датируются
+        # согласованно, без повторных вызовов datetime.now.
+        turn_ts = datetime.now(timezone.utc).isoformat()
+        # Вопрос, на который отвечает кандидат, — реплика интервьюера
+        # прошлого хода; фиксируется до генерации нового ответа.
+        prev_assistant = self.last_assistant_msg
+        self._push_history("user", user_msg)
 
-        analysis = self.mentor.analyze(user_msg, self.history, self.difficulty, self.topics_covered)
+        if any(cmd in user_msg.lower() for cmd in ["стоп", "stop", "фидбэк", "feedback"]):
+            if defer_feedback:
+                self._feedback_task = asyncio.create_task(self._gen_feedback())
+                return "Спасибо за интервью! Итоговый отчёт уже генерируется..."
+            return await self._gen_feedback()
+
+        # Если в ответе есть версии/числа ("Python 4.0" и т.п.), фактчекер
+        # запускается спекулятивно параллельно с анализом ментора: оба
+        # вызова сетевые, и на ходах с галлюцинациями это экономит целый
+        # round-trip. Ненужный результат просто отбрасывается.
+        speculative_fc = None
+        if not self.multi_agent:
+            # Комбинированный анализатор возвращает проверку фактов
+            # в том же ответе — отдельный вызов фактчекера не нужен.
+            analysis = await self.analyzer.analyze(
+                user_msg, self.history, self.difficulty, self.topics_covered,
+                history_formatted=self._history_formatted
+            )
+            speculative_fc = analysis.get("fact_check") or None
+        elif _VERSION_HINT_RE.search(user_msg.lower()):
+            analysis, speculative_fc = await asyncio.gather(
+                self.mentor.analyze(user_msg, self.history, self.difficulty, self.topics_covered,
+                                    history_formatted=self._history_formatted),
+                self.fact_checker.check(user_msg)
+            )
+        else:
+            analysis = await self.mentor.analyze(
+                user_msg, self.history, self.difficulty, self.topics_covered,
+                history_formatted=self._history_formatted
+            )
 
         edge_case = self._detect_edge_case(user_msg, analysis)
 
@@ -738,10 +1156,9 @@ class MultiAgentInterviewCoach:
             if topic and topic not in self.topics_covered:
                 self.topics_covered.append(topic)
 
-        if len(self.history) >= 2:
-            last_question = self.history[-2]["content"] if self.history[-2]["role"] == "assistant" else ""
+        if prev_assistant:
             self.questions_asked.append({
-                "question": last_question,
+                "question": prev_assistant,
                 "answer": user_msg,
                 "is_correct": analysis.get("is_correct"),
                 "correctness_score": analysis.get("correctness_score", 0),
@@ -762,14 +1179,17 @@ class MultiAgentInterviewCoach:
                     f"Уверенность: {analysis.get('confidence_level', 'unknown')}. "
                     f"Сложность: {analysis.get('difficulty_recommendation', 'maintain')}. "
                     f"Edge case: {edge_case or 'none'}. "
-                    f"Рекомендация: {analysis.get('recommendation', '')}"
+                    f"Рекомендация: {analysis.get('recommendation', '')}",
+            timestamp=turn_ts
         )
         self.thoughts.append(mentor_thought)
 
         fc_thought = None
         if analysis.get("is_hallucination"):
-            fc_result = self.fact_checker.check(user_msg)
-            
+            fc_result = speculative_fc
+            if fc_result is None:
+                fc_result = await self.fact_checker.check(user_msg)
+
             if not fc_result.get("is_true", True):
                 flag = f"ГАЛЛЮЦИНАЦИЯ: {fc_result.get('explanation', 'Некорректное утверждение')}. Правильная информация: {fc_result.get('correct_info', '')}"
                 self.red_flags.append(flag)
@@ -779,7 +1199,8 @@ class MultiAgentInterviewCoach:
                     to_agent="Interviewer",
                     content=f"ALERT: Пользователь галлюцинирует. {fc_result.get('explanation', '')}. "
                             f"Правильная информация: {fc_result.get('correct_info', '')}. "
-                            f"Это критическая ошибка знаний. Пометь как 'red flag'."
+                            f"Это критическая ошибка знаний. Пометь как 'red flag'.",
+                    timestamp=turn_ts
                 )
                 self.thoughts.append(fc_thought)
 
@@ -790,55 +1211,70 @@ class MultiAgentInterviewCoach:
             advice = "Кандидат задал вопрос. ОБЯЗАТЕЛЬНО ответь на него кратко и профессионально, затем продолжи интервью."
         elif analysis.get("is_off_topic"):
             advice = "Кандидат ушёл от темы. Вежливо верни беседу к техническому интервью."
-        elif edge_case == "dont_know":
-            advice = "Кандидат признал незнание. Похвали за честность, КРАТКО объясни правильный ответ и перейди к более простой теме."
-        elif edge_case == "silence":
-            advice = "Кандидат молчит или дал пустой ответ. Подбодри его и переформулируй вопрос проще."
-        elif edge_case == "rude":
-            advice = "Кандидат ведёт себя непрофессионально. Сохраняй спокойствие, напомни о формате интервью."
-        elif edge_case == "troll":
-            advice = "Кандидат даёт несерьёзные ответы. Игнорируй и задай следующий вопрос."
+        elif edge_case in _EDGE_ADVICE:
+            advice = _EDGE_ADVICE[edge_case]
         elif analysis.get("difficulty_recommendation") == "increase":
             advice += " Кандидат справляется хорошо — задай более сложный вопрос."
         elif analysis.get("difficulty_recommendation") == "decrease":
             advice += " Кандидат затрудняется — упрости следующий вопрос или дай подсказку."
 
-        resp = self.interviewer.generate_response(
+        resp = await self.interviewer.generate_response(
             self.candidate, self.history, advice, self.turn_num,
             self.difficulty, self.correct_streak,
-            self.topics_covered, edge_case
+            self.topics_covered, edge_case, on_token=on_token,
+            role=self._role, role_topics_map=self._role_topics_map,
+            history_formatted=self._history_formatted
         )
-        
-        self.history.append({"role": "assistant", "content": resp})
+
+        self._push_history("assistant", resp)
 
         thoughts_str = f"[Observer]: {mentor_thought.content}"
         if fc_thought:
             thoughts_str += f" [FactChecker]: {fc_thought.content}"
         
-        last_msg = self.history[-3]["content"] if len(self.history) >= 3 else ""
-        self.turns.append({
+        turn = {
             "turn_id": self.turn_num,
-            "agent_visible_message": last_msg,
+            "agent_visible_message": prev_assistant,
             "user_message": user_msg,
             "internal_thoughts": thoughts_str,
             "difficulty_level": self.difficulty,
             "edge_case": edge_case,
-            "timestamp": datetime.now().isoformat()
-        })
-        
+            "timestamp": turn_ts
+        }
+        self.turns.append(turn)
+        self._log_turn_ndjson(turn)
+
         return resp
+
+    def _log_turn_ndjson(self, turn: Dict) -> None:
+        """Дописывает один ход в NDJSON-журнал."""
+        if self._ndjson_fp is None:
+            return
+        self._ndjson_fp.write(_json_dumps(turn) + "\n")
+        self._ndjson_fp.flush()
     
-    def _gen_feedback(self) -> str:
+    async def _gen_feedback(self) -> str:
         """Генерирует итоговый отчёт по интервью."""
-        
+
         self.finished = True
-        
-        feedback = self.feedback_gen.generate(
-            self.history, self.thoughts, self.candidate, 
-            self.difficulty_history, self.questions_asked
+
+        feedback = await self.feedback_gen.generate(
+            self.history, self.thoughts, self.candidate,
+            self.difficulty_history, self.questions_asked,
+            history_formatted=self._history_formatted
         )
-        
-        report = f"""
+
+        # Деградировавший результат (без вердикта) не стоит сборки
+        # полного Markdown-отчёта — тот же гвард, что в
+        # LogAdapter._format_feedback_markdown.
+        if not feedback or not feedback.get("verdict"):
+            self.final_feedback = feedback or {}
+            return "Интервью не завершено или отзыв отсутствует."
+
+        # Отчёт собирается списком фрагментов с одним join в конце:
+        # накопление через `report += ...` копирует растущий буфер
+        # на каждой итерации.
+        parts = [f"""
 # Итоговый отчёт по интервью
 
 ## Информация о кандидате
@@ -878,25 +1314,25 @@ class MultiAgentInterviewCoach:
 ## Технический обзор
 
 ### Подтвержденные навыки:
-"""
+"""]
         for skill in feedback['technical_review'].get('confirmed_skills', []):
-            report += f"- {skill}\n"
-        
-        report += "\n### Пробелы в знаниях:\n"
+            parts.append(f"- {skill}\n")
+
+        parts.append("\n### Пробелы в знаниях:\n")
         for gap in feedback['technical_review'].get('knowledge_gaps', []):
             if isinstance(gap, dict):
-                report += f"- **{gap.get('topic', 'N/A')}**\n"
+                parts.append(f"- **{gap.get('topic', 'N/A')}**\n")
                 if gap.get('question'):
-                    report += f"  - Вопрос: {gap['question']}\n"
+                    parts.append(f"  - Вопрос: {gap['question']}\n")
                 if gap.get('candidate_answer'):
-                    report += f"  - Ответ кандидата: {gap['candidate_answer']}\n"
+                    parts.append(f"  - Ответ кандидата: {gap['candidate_answer']}\n")
                 if gap.get('correct_answer'):
-                    report += f"  - ✓ Правильный ответ: {gap['correct_answer']}\n"
+                    parts.append(f"  - ✓ Правильный ответ: {gap['correct_answer']}\n")
             else:
-                report += f"- {gap}\n"
-        
+                parts.append(f"- {gap}\n")
+
         soft = feedback.get('soft_skills', {})
-        report += f"""
+        parts.append(f"""
 ---
 
 ## Soft Skills
@@ -914,34 +1350,47 @@ class MultiAgentInterviewCoach:
 ## Рекомендации по развитию (Roadmap)
 
 ### Темы для изучения:
-"""
+""")
         for topic in feedback['roadmap'].get('topics_to_improve', []):
-            report += f"- {topic}\n"
-        
-        report += "\n### Рекомендуемые ресурсы:\n"
+            parts.append(f"- {topic}\n")
+
+        parts.append("\n### Рекомендуемые ресурсы:\n")
         for res in feedback['roadmap'].get('resources', []):
-            report += f"- {res}\n"
-        
-        report += f"""
+            parts.append(f"- {res}\n")
+
+        parts.append(f"""
 ---
 
 ## Резюме
 
 {feedback.get('summary', '')}
-"""
-        
+""")
+
         self.final_feedback = feedback
-        
-        return report
+
+        return "".join(parts)
     
-    def get_log(self) -> Dict:
+    async def get_feedback(self) -> str:
+        """Возвращает итоговый отчёт, дожидаясь фоновой генерации.
+
+        Если отчёт был запущен через process(..., defer_feedback=True),
+        ожидает его задачу; иначе генерирует отчёт синхронно.
+        """
+        if self._feedback_task is not None:
+            return await self._feedback_task
+        return await self._gen_feedback()
+
+    def get_log(self, timestamp: str = None) -> Dict:
         """
         Возвращает полный лог интервью в формате, соответствующем ТЗ.
+
+        timestamp позволяет вызывающему зафиксировать один штамп на
+        несколько производных файлов лога.
         """
         return {
             "participant_name": self.candidate.get("name", "Unknown"),
             "team_name": self.team_name,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": timestamp or datetime.now(timezone.utc).isoformat(),
             "candidate": self.candidate,
             "turns": self.turns,
             "topics_covered": self.topics_covered,
@@ -950,29 +1399,56 @@ class MultiAgentInterviewCoach:
             "final_feedback": getattr(self, 'final_feedback', None)
         }
     
-    def save_log(self, path: str = None) -> str:
-        """Сохраняет лог интервью в JSON-файл."""
-        
+    def save_log(self, path: str = None, *, fixed_format: bool = None) -> str:
+        """Сохраняет лог интервью в JSON-файл.
+
+        fixed_format управляет записью дополнительного файла в
+        фиксированном формате: по умолчанию он пропускается (минус
+        полный проход сериализации и запись на диск), включается
+        аргументом или переменной окружения INTERVIEW_EMIT_FIXED=1.
+        """
+
+        if fixed_format is None:
+            fixed_format = os.environ.get("INTERVIEW_EMIT_FIXED") == "1"
+
         if path is None:
             ts = datetime.now().strftime("%Y%m%d_%H%M%S")
             path = f"logs/interview_log_{ts}.json"
             fixed_path = f"logs/fixed_format_log_{ts}.json"
         else:
             fixed_path = path.replace(".json", "_fixed.json")
-        
-        os.makedirs(os.path.dirname(path), exist_ok=True)
 
-        with open(fixed_path, 'w', encoding='utf-8') as f:
-            f.write(LogAdapter.to_json(self))
-        
+        self._ensure_dir(os.path.dirname(path))
+
+        # Лог собирается один раз: и фиксированный формат, и основной
+        # файл пишутся из одного словаря (transform принимает dict).
+        log_dict = self.get_log()
+
+        if fixed_format:
+            with open(fixed_path, 'w', encoding='utf-8') as f:
+                f.write(LogAdapter.to_json(log_dict, indent=2 if self.pretty else None))
+
+        # Сериализация в строку и одна запись: json.dump пишет в файл
+        # множеством мелких кусков из iterencode, что заметно медленнее.
         with open(path, 'w', encoding='utf-8') as f:
-            json.dump(self.get_log(), f, ensure_ascii=False, indent=2)
-        
+            f.write(_json_dumps(log_dict, self.pretty))
+
+        # Консолидированный лог записан — инкрементальный журнал
+        # больше не нужен.
+        if self._ndjson_fp is not None:
+            self._ndjson_fp.close()
+            self._ndjson_fp = None
+
         return path
 
 
-def interactive_mode():
-    """Интерактивный режим — пользователь отвечает на вопросы в терминале."""
+async def interactive_mode(pretty: bool = False, multi_agent: bool = False):
+    """Интерактивный режим — пользователь отвечает на вопросы в терминале.
+
+    Вся сессия выполняется в одном event loop: keep-alive соединения
+    модульного httpx-пула привязаны к циклу, и asyncio.run на каждый
+    ход ронял бы второй LLM-вызов с «Event loop is closed».
+    """
     
     print("=" * 70)
     print("MULTI-AGENT INTERVIEW COACH")
@@ -994,11 +1470,17 @@ def interactive_mode():
     print(f"Опыт: {experience}")
     print("-" * 70)
     
-    coach = MultiAgentInterviewCoach()
-    
-    first_msg = coach.start(name, position, grade, experience)
+    coach = MultiAgentInterviewCoach(pretty=pretty, multi_agent=multi_agent)
+
+    # Ответы интервьюера печатаются по мере генерации: первый токен
+    # появляется сразу, без ожидания полного ответа.
     print(f"\n[Уровень сложности: {coach.difficulty}/10]")
-    print(f"\nИнтервьюер: {first_msg}")
+    print("\nИнтервьюер: ", end="", flush=True)
+    await coach.start(
+        name, position, grade, experience,
+        on_token=lambda tok: print(tok, end="", flush=True)
+    )
+    print()
     
     print("\n" + "=" * 70)
     print("Команды: 'стоп' или 'фидбэк' — завершить интервью и получить отчёт")
@@ -1016,12 +1498,30 @@ def interactive_mode():
             print("\nВыход без сохранения...")
             break
         
-        response = coach.process(user_input)
-        print(f"\n[Уровень сложности: {coach.difficulty}/10]")
-        print(f"\nИнтервьюер: {response}")
-        
+        print("\nИнтервьюер: ", end="", flush=True)
+        streamed = []
+
+        def _show(tok, _streamed=streamed):
+            _streamed.append(tok)
+            print(tok, end="", flush=True)
+
+        # Сессия живёт в одном event loop, поэтому команда завершения
+        # может не блокировать ход: кандидат сразу видит подтверждение,
+        # пока отчёт генерируется фоновой задачей.
+        response = await coach.process(
+            user_input, on_token=_show, defer_feedback=True
+        )
+        if not streamed:
+            # Подтверждение завершения не стримится — печатаем целиком.
+            print(response, end="")
+        print(f"\n\n[Уровень сложности: {coach.difficulty}/10]")
+
+        if coach._feedback_task is not None:
+            report = await coach.get_feedback()
+            print(f"\n{report}")
+
         if coach.finished:
-            log_path = coach.save_log()
+            log_path = coach.save_log(fixed_format=True)
             print(f"\n{'=' * 70}")
             print(f"Лог интервью сохранён: {log_path}")
             print(f"{'=' * 70}")
@@ -1030,7 +1530,7 @@ def interactive_mode():
     return coach
 
 
-def demo_mode():
+async def demo_mode(pretty: bool = False, multi_agent: bool = False):
     """Демо-режим с готовым сценарием."""
     
     print("=" * 70)
@@ -1038,8 +1538,8 @@ def demo_mode():
     print("Демо-режим (готовый сценарий)")
     print("=" * 70)
     
-    coach = MultiAgentInterviewCoach()
-    
+    coach = MultiAgentInterviewCoach(pretty=pretty, multi_agent=multi_agent)
+
     print("\n[Инициализация интервью]")
     print("-" * 70)
     print("Кандидат: Алекс")
@@ -1048,7 +1548,7 @@ def demo_mode():
     print("Опыт: Пет-проекты на Django, немного SQL")
     print("-" * 70)
     
-    first_msg = coach.start("Алекс", "Backend Developer", "Junior", "Пет-проекты на Django, немного SQL")
+    first_msg = await coach.start("Алекс", "Backend Developer", "Junior", "Пет-проекты на Django, немного SQL")
     print(f"\n[Уровень сложности: {coach.difficulty}/10]")
     print(f"\nИнтервьюер: {first_msg}")
     print("-" * 70)
@@ -1074,12 +1574,12 @@ def demo_mode():
         print(f"\n{step}")
         print(f"Кандидат: {response}")
         
-        agent_resp = coach.process(response)
+        agent_resp = await coach.process(response)
         print(f"\n[Уровень сложности: {coach.difficulty}/10]")
         print(f"\nИнтервьюер: {agent_resp}")
         print("-" * 70)
     
-    log_path = coach.save_log()
+    log_path = coach.save_log(fixed_format=True)
     print(f"\n{'=' * 70}")
     print(f"Лог интервью сохранён: {log_path}")
     print(f"{'=' * 70}")
@@ -1088,16 +1588,26 @@ def demo_mode():
 
 
 if __name__ == "__main__":
+    pretty = "--pretty" in sys.argv
+    multi_agent = "--multi-agent" in sys.argv
+    if "--no-cache" in sys.argv:
+        llm_cache.disable()
     if len(sys.argv) > 1:
         if sys.argv[1] == "--demo":
-            demo_mode()
+            asyncio.run(demo_mode(pretty=pretty, multi_agent=multi_agent))
         elif sys.argv[1] == "--interactive":
-            interactive_mode()
+            asyncio.run(interactive_mode(pretty=pretty, multi_agent=multi_agent))
         else:
             print("Использование:")
             print("  python interview_system_v2.py --interactive  # Интерактивный режим")
             print("  python interview_system_v2.py --demo         # Демо-режим")
+            print("  Дополнительно: --pretty — сохранять JSON-логи с отступами")
+            print("                 --no-cache — не кэшировать ответы LLM")
+            print("                 --multi-agent — раздельные ментор и фактчекер")
     else:
         print("Использование:")
         print("  python interview_system_v2.py --interactive  # Интерактивный режим")
         print("  python interview_system_v2.py --demo         # Демо-режим")
+        print("  Дополнительно: --pretty — сохранять JSON-логи с отступами")
+        print("                 --no-cache — не кэшировать ответы LLM")
+        print("                 --multi-agent — раздельные ментор и фактчекер")
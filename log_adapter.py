@@ -5,6 +5,20 @@
 import json
 from typing import Dict, Any, Union
 
+# orjson сериализует лог в разы быстрее stdlib json (C-реализация,
+# не-ASCII символы не экранируются, как при ensure_ascii=False);
+# зависимость необязательная.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Ровно те поля хода, которые попадают в фиксированный формат.
+_TURN_KEYS = frozenset(
+    {"turn_id", "agent_visible_message", "user_message", "internal_thoughts"}
+)
+
 
 class LogAdapter:
     """Адаптер для преобразования данных интервью в требуемый формат логов."""
@@ -108,14 +122,21 @@ class LogAdapter:
             raw_turns = getattr(coach_or_state, "turns", [])
             raw_feedback = getattr(coach_or_state, "final_feedback", {})
 
-        turns = []
-        for turn in raw_turns:
-            turns.append({
-                "turn_id": turn.get("turn_id"),
-                "agent_visible_message": turn.get("agent_visible_message"),
-                "user_message": turn.get("user_message"),
-                "internal_thoughts": turn.get("internal_thoughts")
-            })
+        # Если ходы уже содержат ровно нужные поля, список используется
+        # как есть — без пересборки каждого словаря и копий строк.
+        if (raw_turns and isinstance(raw_turns[0], dict)
+                and raw_turns[0].keys() == _TURN_KEYS):
+            turns = raw_turns
+        else:
+            turns = [
+                {
+                    "turn_id": turn.get("turn_id"),
+                    "agent_visible_message": turn.get("agent_visible_message"),
+                    "user_message": turn.get("user_message"),
+                    "internal_thoughts": turn.get("internal_thoughts")
+                }
+                for turn in raw_turns
+            ]
 
         if isinstance(raw_feedback, dict) and raw_feedback:
             final_feedback_str = LogAdapter._format_feedback_markdown(raw_feedback)
@@ -132,6 +153,10 @@ class LogAdapter:
     def to_json(coach_or_state: Any, indent: int = 2) -> str:
         """Возвращает преобразованный лог в формате JSON-строки."""
         data = LogAdapter.transform(coach_or_state)
+        # orjson поддерживает только отступ 2 или его отсутствие.
+        if orjson is not None and indent in (2, None):
+            option = orjson.OPT_INDENT_2 if indent == 2 else 0
+            return orjson.dumps(data, option=option).decode()
         return json.dumps(data, ensure_ascii=False, indent=indent)
 
 
@@ -5,6 +5,7 @@ Multi-Agent Interview Coach — система из нескольких AI-аг
 проведения технических интервью с возможностью скрытой рефлексии.
 """
 
+import asyncio
 import sys
 import json
 from datetime import datetime
@@ -13,12 +14,21 @@ from typing import Optional
 
 from langchain_core.messages import HumanMessage, AIMessage
 
-from state import create_initial_state, InterviewState, Turn
+from state import create_initial_state, thought_timestamp, InterviewState, Turn
 from graph import create_interview_graph
 from utils.logger import InterviewLogger, create_log_from_state
 from config import TEAM_NAME
 
 
+def _last_ai_content(messages, default: str) -> str:
+    """Содержимое последнего AIMessage: поиск с конца без полного
+    прохода и промежуточного списка."""
+    return next(
+        (m.content for m in reversed(messages) if isinstance(m, AIMessage)),
+        default,
+    )
+
+
 class InterviewCoach:
     """Основной класс для проведения технических интервью."""
     
@@ -29,7 +39,7 @@ class InterviewCoach:
         self.logger = InterviewLogger(team_name)
         self.current_turn = 0
         
-    def start_interview(
+    async def start_interview(
         self,
         candidate_name: str,
         position: str,
@@ -38,7 +48,13 @@ class InterviewCoach:
         difficulty_mode: str = "adaptive",
         initial_difficulty_level: Optional[int] = None,
     ) -> str:
-        """Начинает новое интервью и возвращает первое сообщение интервьюера."""
+        """Начинает новое интервью и возвращает первое сообщение интервьюера.
+
+        Методы коуча асинхронные: вся сессия живёт в одном event loop,
+        иначе keep-alive соединения общего httpx-пула остаются
+        привязанными к закрытому циклу и второй ход падает с
+        «Event loop is closed».
+        """
         self.state = create_initial_state(
             candidate_name=candidate_name,
             position=position,
@@ -55,32 +71,30 @@ class InterviewCoach:
             "experience": experience
         })
 
-        result = self.graph.invoke(self.state)
+        result = await self.graph.ainvoke(self.state)
         self.state = result
 
         self.state["messages"] = self.state.get("messages", [])[-3:]
-        
-        ai_messages = [m for m in result["messages"] if isinstance(m, AIMessage)]
-        first_message = ai_messages[-1].content if ai_messages else "Привет! Давайте начнем интервью."
-        
-        return first_message
-    
-    def process_response(self, user_message: str) -> str:
+
+        return _last_ai_content(
+            result["messages"], "Привет! Давайте начнем интервью."
+        )
+
+    async def process_response(self, user_message: str) -> str:
         """Обрабатывает ответ кандидата и возвращает следующее сообщение."""
         if self.state is None:
             return "Ошибка: интервью не начато. Вызовите start_interview() сначала."
         
         self.current_turn += 1
         
-        ai_messages = [m for m in self.state["messages"] if isinstance(m, AIMessage)]
-        last_agent_message = ai_messages[-1].content if ai_messages else ""
-        
-        self.state["messages"] = self.state["messages"] + [HumanMessage(content=user_message)]
+        last_agent_message = _last_ai_content(self.state["messages"], "")
+
+        self.state["messages"].append(HumanMessage(content=user_message))
         self.state["current_turn"] = self.current_turn
 
         self.state["messages"] = self.state.get("messages", [])[-3:]
         
-        result = self.graph.invoke(self.state)
+        result = await self.graph.ainvoke(self.state)
         self.state = result
 
         self.state["messages"] = self.state.get("messages", [])[-3:]
@@ -97,7 +111,7 @@ class InterviewCoach:
                     "from_agent": t["from_agent"],
                     "to_agent": t["to_agent"],
                     "content": t["content"],
-                    "timestamp": t.get("timestamp", "")
+                    "timestamp": thought_timestamp(t)
                 }
                 for t in thoughts_for_turn
             ]
@@ -114,17 +128,16 @@ class InterviewCoach:
         )
         self.state["turns"] = self.state.get("turns", []) + [turn]
         
-        ai_messages = [m for m in result["messages"] if isinstance(m, AIMessage)]
-        response = ai_messages[-1].content if ai_messages else "Продолжим интервью."
+        response = _last_ai_content(result["messages"], "Продолжим интервью.")
         
         if result.get("interview_finished"):
             self.logger.set_final_feedback(result.get("final_feedback", {}))
         
         return response
     
-    def end_interview(self) -> str:
+    async def end_interview(self) -> str:
         """Принудительно завершает интервью и генерирует отчёт."""
-        return self.process_response("Стоп игра. Давай фидбэк.")
+        return await self.process_response("Стоп игра. Давай фидбэк.")
     
     def save_log(self, filepath: str = None) -> str:
         """Сохраняет лог интервью в JSON-файл."""
@@ -135,7 +148,7 @@ class InterviewCoach:
         return self.state
 
 
-def run_scenario():
+async def run_scenario():
     """Запускает тестовый сценарий интервью."""
     print("=" * 60)
     print("MULTI-AGENT INTERVIEW COACH")
@@ -158,7 +171,7 @@ def run_scenario():
     print()
     print("-" * 60)
     
-    first_message = coach.start_interview(
+    first_message = await coach.start_interview(
         candidate_name=candidate_info['name'],
         position=candidate_info['position'],
         grade=candidate_info['grade'],
@@ -193,7 +206,7 @@ def run_scenario():
         print(f"\n{step['step']}")
         print(f"Кандидат: {step['response']}")
         
-        response = coach.process_response(step['response'])
+        response = await coach.process_response(step['response'])
         print(f"\nИнтервьюер: {response}")
         print("-" * 60)
     
@@ -203,7 +216,7 @@ def run_scenario():
     return coach
 
 
-def interactive_mode():
+async def interactive_mode():
     """Интерактивный режим интервью."""
     print("=" * 60)
     print("MULTI-AGENT INTERVIEW COACH - Интерактивный режим")
@@ -218,7 +231,7 @@ def interactive_mode():
     
     coach = InterviewCoach()
     
-    first_message = coach.start_interview(
+    first_message = await coach.start_interview(
         candidate_name=name,
         position=position,
         grade=grade,
@@ -239,7 +252,7 @@ def interactive_mode():
             print("\nЗавершение без сохранения...")
             break
         
-        response = coach.process_response(user_input)
+        response = await coach.process_response(user_input)
         print(f"\nИнтервьюер: {response}")
         
         if coach.state.get("interview_finished"):
@@ -252,6 +265,6 @@ def interactive_mode():
 
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "--interactive":
-        interactive_mode()
+        asyncio.run(interactive_mode())
     else:
-        run_scenario()
+        asyncio.run(run_scenario())
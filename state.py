@@ -4,26 +4,82 @@
 Содержит TypedDict-классы для типизации данных,
 передаваемых между агентами.
 """
-from typing import TypedDict, List, Dict, Any, Annotated, Optional
+from dataclasses import dataclass
+from datetime import datetime
+from typing import TypedDict, List, Dict, Any, Annotated, Optional, Set
 from langchain_core.messages import BaseMessage
-import operator
 
+# Сколько последних сообщений хранится в состоянии графа. Агенты читают
+# только хвост истории, а полная история хода фиксируется в turns —
+# без окна каждый снапшот состояния рос бы линейно с числом ходов.
+MESSAGE_WINDOW = 8
 
-class InternalThought(TypedDict):
-    """Внутренняя мысль агента, невидимая для кандидата."""
+
+def _merge_recent_messages(
+    left: List[BaseMessage], right: List[BaseMessage]
+) -> List[BaseMessage]:
+    """Редьюсер сообщений: добавляет новые и оставляет последние N."""
+    return (list(left or []) + list(right or []))[-MESSAGE_WINDOW:]
+
+
+@dataclass(slots=True, frozen=True)
+class InternalThought:
+    """Внутренняя мысль агента, невидимая для кандидата.
+
+    Неизменяемый слотовый датакласс: за 50-ходовое интервью таких
+    записей накапливаются сотни, и отказ от per-instance __dict__
+    экономит память и ускоряет доступ к полям. Индексация и .get()
+    сохранены для существующего кода в стиле словаря.
+
+    Вместо готовой ISO-строки хранится порядковый номер и «сырое»
+    время time.time(): форматирование и tz-резолвинг не выполняются
+    на горячем пути, а штамп не попадает в кэшируемые префиксы
+    промптов. В строку время разворачивает thought_timestamp.
+    """
     from_agent: str
     to_agent: str
     content: str
-    timestamp: str
+    seq: int
+    ts: float
+    # Ход, на котором родилась мысль; по нему create_log_from_state
+    # группирует мысли по ходам.
+    turn_id: int = 0
+
+    def __getitem__(self, key: str) -> Any:
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
 
 
-class Turn(TypedDict):
-    """Один ход диалога интервью."""
+def thought_timestamp(thought: InternalThought) -> str:
+    """Возвращает время мысли в ISO-формате (граница сериализации)."""
+    ts = thought.get("ts")
+    if ts is not None:
+        return datetime.fromtimestamp(ts).isoformat()
+    return thought.get("timestamp", "")
+
+
+@dataclass(slots=True)
+class Turn:
+    """Один ход диалога интервью.
+
+    Слотовый датакласс вместо TypedDict: у TypedDict в рантайме это
+    обычный dict с хеш-таблицей на каждый ход, у слотового класса —
+    компактная фиксированная раскладка. Доступ в стиле словаря
+    сохранён, как у InternalThought.
+    """
     turn_id: int
     agent_visible_message: str
     user_message: str
     internal_thoughts: str
 
+    def __getitem__(self, key: str) -> Any:
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
 
 class CandidateInfo(TypedDict):
     """Информация о кандидате."""
@@ -40,13 +96,13 @@ class InterviewState(TypedDict):
     Передаётся между агентами и содержит всю информацию
     о текущем состоянии интервью.
     """
-    messages: Annotated[List[BaseMessage], operator.add]
+    messages: Annotated[List[BaseMessage], _merge_recent_messages]
     candidate: CandidateInfo
     turns: List[Turn]
     internal_thoughts: List[InternalThought]
     current_turn: int
-    topics_covered: List[str]
-    confirmed_skills: List[str]
+    topics_covered: Set[str]
+    confirmed_skills: Set[str]
     knowledge_gaps: List[Dict[str, str]]
     red_flags: List[str]
     difficulty_level: int
@@ -57,16 +113,22 @@ class InterviewState(TypedDict):
     final_feedback: Dict[str, Any]
 
 
+# Соответствие грейда стартовой сложности; порядок важен —
+# "junior+" должен проверяться раньше "junior".
+_GRADE_RULES = (
+    ("senior", 8),
+    ("middle", 6),
+    ("junior+", 5),
+    ("junior plus", 5),
+    ("junior", 3),
+)
+
+
 def _grade_to_initial_difficulty(grade: str) -> int:
     grade_lower = (grade or "").lower()
-    if "senior" in grade_lower:
-        return 8
-    if "middle" in grade_lower:
-        return 6
-    if "junior+" in grade_lower or "junior plus" in grade_lower:
-        return 5
-    if "junior" in grade_lower:
-        return 3
+    for key, level in _GRADE_RULES:
+        if key in grade_lower:
+            return level
     return 2
 
 
@@ -109,8 +171,8 @@ def create_initial_state(
         turns=[],
         internal_thoughts=[],
         current_turn=0,
-        topics_covered=[],
-        confirmed_skills=[],
+        topics_covered=set(),
+        confirmed_skills=set(),
         knowledge_gaps=[],
         red_flags=[],
         difficulty_level=difficulty_level,
@@ -0,0 +1,64 @@
+"""
+Дисковый кэш ответов LLM.
+
+Ключ — blake2b от канонического представления запроса (модель,
+температура, system-префикс, prompt); значение — текст ответа.
+Повторные прогоны demo_mode и одинаковых сценариев обслуживаются
+из файлов в .llm_cache без обращения к API. Отключается флагом
+--no-cache в CLI.
+"""
+import hashlib
+import json
+from pathlib import Path
+from typing import Optional
+
+CACHE_DIR = Path(".llm_cache")
+
+_enabled = True
+
+
+def disable() -> None:
+    """Отключает кэш (флаг --no-cache)."""
+    global _enabled
+    _enabled = False
+
+
+def enable() -> None:
+    """Включает кэш (включён по умолчанию)."""
+    global _enabled
+    _enabled = True
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def make_key(model: str, temperature: float, system: Optional[str],
+             prompt: str) -> str:
+    """Строит ключ кэша из всех параметров, влияющих на ответ."""
+    payload = json.dumps(
+        [model, round(temperature, 3), system or "", prompt],
+        ensure_ascii=False
+    ).encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def get(key: str) -> Optional[str]:
+    """Возвращает закэшированный ответ или None."""
+    if not _enabled:
+        return None
+    try:
+        return (CACHE_DIR / f"{key}.txt").read_text(encoding="utf-8")
+    except OSError:
+        return None
+
+
+def put(key: str, response: str) -> None:
+    """Сохраняет ответ в кэш; ошибки записи не критичны."""
+    if not _enabled or not response:
+        return
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        (CACHE_DIR / f"{key}.txt").write_text(response, encoding="utf-8")
+    except OSError:
+        pass
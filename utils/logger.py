@@ -4,18 +4,69 @@
 Сохраняет историю диалога, внутренние мысли агентов
 и итоговый отчёт в структурированном виде.
 """
+import gzip
 import json
+import os
+import queue
+import sys
+import threading
+from collections import defaultdict
+from dataclasses import asdict
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from pathlib import Path
 
-from state import InterviewState, Turn
+# orjson (C-реализация) кодирует лог в разы быстрее stdlib json и
+# всегда пишет UTF-8 без экранирования кириллицы; зависимость
+# необязательная.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# msgpack — бинарный формат для save_msgpack(): компактнее и быстрее
+# JSON, но нечитаем глазами. Тоже необязательная зависимость.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Готовые энкодеры для stdlib-пути: конфигурация разбирается один раз
+# на модуль, а не при каждом save(). check_circular выключен — лог
+# собирается внутри класса и циклов не содержит. Компактный вариант
+# (без отступов и пробелов после разделителей) заметно уменьшает файл
+# на длинных интервью; лог читают скрипты, а не люди.
+_ENCODER = json.JSONEncoder(
+    ensure_ascii=False, separators=(',', ':'), check_circular=False
+)
+_PRETTY_ENCODER = json.JSONEncoder(
+    ensure_ascii=False, indent=2, check_circular=False
+)
+
+# Поля записи журнала мыслей — порядок совпадает с колонками
+# InterviewLogger._tl_*.
+_THOUGHT_FIELDS = ("turn_id", "from", "to", "content", "timestamp")
+
+# Порог gzip-сжатия при сохранении: журнал интервью — сильно избыточный
+# текст (повторяющиеся имена агентов и полей) и жмётся в 5–10 раз;
+# мелкие логи не стоят ни CPU, ни суффикса .gz.
+_GZIP_THRESHOLD = 64 * 1024
+
+
+def _dumps_compact(obj: Any) -> str:
+    """Компактная JSON-строка для потоковых фрагментов лога."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+from state import InterviewState, Turn, thought_timestamp
 
 
 class InterviewLogger:
     """Класс для логирования хода интервью в JSON-формате."""
     
-    def __init__(self, team_name: str = "Multi-Agent Interview Coach"):
+    def __init__(self, team_name: str = "Multi-Agent Interview Coach",
+                 stream_path: str = None):
         self.team_name = team_name
         self.log_data = {
             "team_name": team_name,
@@ -25,61 +76,353 @@ class InterviewLogger:
             "internal_thoughts_log": [],
             "final_feedback": {}
         }
+        # Потоковый режим (опциональный): при заданном stream_path
+        # каждый ход дописывается в файл сразу в log_turn, а
+        # finalize() дописывает эпилог и закрывает документ. Стоимость
+        # сериализации и записи размазывается по ходам вместо одного
+        # большого save(), и почти готовый лог переживает аварийное
+        # завершение. Пролог пишется лениво при первом ходе, когда
+        # информация о кандидате уже установлена.
+        self._stream_path = stream_path
+        self._stream_fp = None
+        self._stream_turns = 0
+        # Фоновая запись (save_async): очередь снапшотов и ленивый
+        # поток-писатель, который сериализует и пишет вне диалогового
+        # пути.
+        self._write_queue = None
+        self._writer_thread = None
+        # Ходы, сериализованные один раз в log_turn: компактный save()
+        # склеивает готовые фрагменты вместо повторного кодирования
+        # всей истории при каждом сохранении.
+        self._turn_blobs: List[str] = []
+        # Каталоги, существование которых уже обеспечено: mkdir со
+        # stat-сисколлом не повторяется при почековых сохранениях.
+        self._ensured_dirs: set = set()
+        # Журнал мыслей хранится поколоночно (structure-of-arrays):
+        # пять параллельных списков вместо словаря на запись — без
+        # per-dict накладных расходов и с последовательным обходом
+        # колонок. Привычный список словарей материализуется в
+        # log_data только на границе сериализации (_sync_thoughts).
+        self._tl_turn_id: List[int] = []
+        self._tl_from: List[str] = []
+        self._tl_to: List[str] = []
+        self._tl_content: List[str] = []
+        self._tl_ts: List[str] = []
+        # Закодированный пролог (team_name/timestamp/candidate + начало
+        # turns): схема фиксированная, содержимое меняется только в
+        # set_candidate_info, поэтому почековые save() его не перекодируют.
+        self._head_blob: Optional[str] = None
     
     def set_candidate_info(self, candidate: Dict[str, str]):
         """Устанавливает информацию о кандидате."""
         self.log_data["candidate"] = candidate
+        self._head_blob = None
     
     def log_turn(self, turn_id: int, agent_message: str, 
                  user_message: str, internal_thoughts: List[Dict[str, str]]):
         """Логирует один ход диалога."""
-        thoughts_str = ""
-        for thought in internal_thoughts:
-            thoughts_str += f"[{thought['from_agent']}]: {thought['content']} "
-        
-        turn = {
-            "turn_id": turn_id,
-            "agent_visible_message": agent_message,
-            "user_message": user_message,
-            "internal_thoughts": thoughts_str.strip()
-        }
-        
+        if internal_thoughts:
+            # join вместо накопления через += : одна аллокация конечного
+            # размера — тот же приём, что в create_log_from_state.
+            thoughts_str = " ".join(
+                f"[{thought['from_agent']}]: {thought['content']}"
+                for thought in internal_thoughts
+            )
+
+            # Один штамп времени на ход: мысли без собственного timestamp
+            # относятся к одному и тому же моменту, и повторные вызовы
+            # datetime.now().isoformat() ничего не добавляют.
+            now_iso = datetime.now().isoformat()
+        else:
+            # Частый случай (например, приветственный ход) — без мыслей;
+            # оба прохода по списку пропускаются.
+            thoughts_str = ""
+
+        # Слотовый Turn вместо словаря: без per-dict хеш-таблицы ход
+        # занимает в разы меньше памяти, а доступ в стиле словаря
+        # сохранён шимами датакласса. Словарь материализуется только
+        # на границе сериализации.
+        turn = Turn(
+            turn_id=turn_id,
+            agent_visible_message=agent_message,
+            user_message=user_message,
+            internal_thoughts=thoughts_str,
+        )
+
         self.log_data["turns"].append(turn)
-        
-        for thought in internal_thoughts:
-            self.log_data["internal_thoughts_log"].append({
-                "turn_id": turn_id,
-                "from": thought["from_agent"],
-                "to": thought["to_agent"],
-                "content": thought["content"],
-                "timestamp": thought.get("timestamp", datetime.now().isoformat())
-            })
-    
+
+        if internal_thoughts:
+            for thought in internal_thoughts:
+                self._tl_turn_id.append(turn_id)
+                # Имена агентов берутся из крошечного набора;
+                # sys.intern склеивает тысячи копий в длинном логе
+                # в одни и те же объекты.
+                self._tl_from.append(sys.intern(thought["from_agent"]))
+                self._tl_to.append(sys.intern(thought["to_agent"]))
+                self._tl_content.append(thought["content"])
+                self._tl_ts.append(thought.get("timestamp", now_iso))
+
+        frag = _dumps_compact(asdict(turn))
+        self._turn_blobs.append(frag)
+
+        if self._stream_path is not None:
+            if self._stream_fp is None:
+                self._open_stream()
+            self._stream_fp.write(("," if self._stream_turns else "") + frag)
+            self._stream_turns += 1
+            self._stream_fp.flush()
+
+    def _ensure_parent(self, filepath: str):
+        """Создаёт родительский каталог файла не чаще одного раза."""
+        parent = str(Path(filepath).parent)
+        if parent not in self._ensured_dirs:
+            Path(parent).mkdir(parents=True, exist_ok=True)
+            self._ensured_dirs.add(parent)
+
+    def _open_stream(self):
+        """Открывает потоковый файл и пишет пролог до списка ходов."""
+        self._ensure_parent(self._stream_path)
+        self._stream_fp = open(self._stream_path, 'w', encoding='utf-8')
+        head = {
+            key: self.log_data[key]
+            for key in ("team_name", "timestamp", "candidate")
+        }
+        # У пролога отрезается закрывающая скобка, чтобы дописать
+        # открытый массив turns.
+        self._stream_fp.write(_dumps_compact(head)[:-1] + ',"turns":[')
+
+    def finalize(self, feedback: Dict[str, Any] = None) -> Optional[str]:
+        """Завершает потоковый лог: эпилог с мыслями и отчётом.
+
+        Возвращает путь к файлу или None, если потоковый режим
+        не включён.
+        """
+        if feedback is not None:
+            self.set_final_feedback(feedback)
+        if self._stream_path is None:
+            return None
+        if self._stream_fp is None:
+            self._open_stream()
+        self._sync_thoughts()
+        self._stream_fp.write(
+            '],"internal_thoughts_log":'
+            + _dumps_compact(self.log_data["internal_thoughts_log"])
+            + ',"final_feedback":'
+            + _dumps_compact(self.log_data["final_feedback"])
+            + '}'
+        )
+        self._stream_fp.close()
+        self._stream_fp = None
+        return self._stream_path
+
+    def _sync_thoughts(self):
+        """Материализует колонки мыслей в список словарей в log_data."""
+        if len(self.log_data["internal_thoughts_log"]) != len(self._tl_turn_id):
+            self.log_data["internal_thoughts_log"] = [
+                dict(zip(_THOUGHT_FIELDS, row))
+                for row in zip(self._tl_turn_id, self._tl_from, self._tl_to,
+                               self._tl_content, self._tl_ts)
+            ]
+
     def set_final_feedback(self, feedback: Dict[str, Any]):
         """Устанавливает итоговый отчёт."""
         self.log_data["final_feedback"] = feedback
     
-    def save(self, filepath: str = None) -> str:
-        """Сохраняет лог в JSON-файл и возвращает путь."""
+    def save(self, filepath: str = None, *, pretty: bool = False) -> str:
+        """Сохраняет лог в JSON-файл (компактно) и возвращает путь.
+
+        Логи крупнее _GZIP_THRESHOLD пишутся через gzip; в этом случае
+        возвращается путь с суффиксом .gz.
+        """
         if filepath is None:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filepath = f"logs/interview_log_{timestamp}.json"
-        
-        Path(filepath).parent.mkdir(parents=True, exist_ok=True)
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(self.log_data, f, ensure_ascii=False, indent=2)
-        
+
+        self._sync_thoughts()
+
+        # Готовые фрагменты используются, только если turns не меняли
+        # в обход log_turn — иначе честная полная сериализация.
+        if not pretty and len(self._turn_blobs) == len(self.log_data["turns"]):
+            if self._head_blob is None:
+                head = {
+                    key: self.log_data[key]
+                    for key in ("team_name", "timestamp", "candidate")
+                }
+                self._head_blob = _dumps_compact(head)[:-1] + ',"turns":['
+            payload = "".join((
+                self._head_blob,
+                ",".join(self._turn_blobs),
+                '],"internal_thoughts_log":',
+                _dumps_compact(self.log_data["internal_thoughts_log"]),
+                ',"final_feedback":',
+                _dumps_compact(self.log_data["final_feedback"]),
+                '}',
+            )).encode('utf-8')
+        else:
+            payload = self._encode_payload(self.log_data, pretty)
+        return self._write_payload(payload, filepath, compress=True)
+
+    @staticmethod
+    def _materialize_turns(log_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Разворачивает слотовые Turn в словари перед сериализацией.
+
+        Поэлементная проверка: в turns могут соседствовать Turn из
+        log_turn и словари, добавленные в обход него.
+        """
+        turns = log_data["turns"]
+        if any(not isinstance(t, dict) for t in turns):
+            return {
+                **log_data,
+                "turns": [t if isinstance(t, dict) else asdict(t)
+                          for t in turns],
+            }
+        return log_data
+
+    @staticmethod
+    def _encode_payload(log_data: Dict[str, Any], pretty: bool) -> bytes:
+        """Кодирует лог в один байтовый буфер."""
+        log_data = InterviewLogger._materialize_turns(log_data)
+
+        if orjson is not None:
+            option = orjson.OPT_INDENT_2 if pretty else 0
+            return orjson.dumps(log_data, option=option)
+        encoder = _PRETTY_ENCODER if pretty else _ENCODER
+        return encoder.encode(log_data).encode('utf-8')
+
+    def _write_payload(self, payload: bytes, filepath: str,
+                       compress: bool) -> str:
+        """Пишет закодированный лог; большие — через gzip с суффиксом .gz."""
+        self._ensure_parent(filepath)
+
+        if compress and len(payload) > _GZIP_THRESHOLD:
+            # compresslevel=1: минимум CPU, основная экономия байтов
+            # всё равно достигается на первом уровне.
+            filepath += ".gz"
+            with gzip.open(filepath, 'wb', compresslevel=1) as f:
+                f.write(payload)
+        else:
+            # Буфер уже закодирован целиком, поэтому прослойки
+            # BufferedWriter/TextIOWrapper не нужны: сырой дескриптор
+            # и os.write кладут его на диск минимумом системных
+            # вызовов (как правило, одним).
+            fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         0o644)
+            try:
+                view = memoryview(payload)
+                while view:
+                    view = view[os.write(fd, view):]
+            finally:
+                os.close(fd)
+        return filepath
+
+    def _write_file(self, log_data: Dict[str, Any], filepath: str,
+                    pretty: bool):
+        """Сериализует и пишет лог в файл (путь save_async)."""
+        self._write_payload(
+            self._encode_payload(log_data, pretty), filepath, compress=False
+        )
+
+    def save_async(self, filepath: str = None, *, pretty: bool = False) -> str:
+        """Ставит сохранение лога в очередь фонового потока.
+
+        Возвращает путь сразу; сериализация и запись выполняются
+        daemon-потоком и не блокируют диалог. Перед выходом из
+        программы стоит дождаться записи через wait_pending().
+        """
+        if filepath is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filepath = f"logs/interview_log_{timestamp}.json"
+
+        if self._writer_thread is None:
+            self._write_queue = queue.Queue()
+            self._writer_thread = threading.Thread(
+                target=self._writer_loop, daemon=True
+            )
+            self._writer_thread.start()
+
+        # Неглубокий снапшот: списки копируются, чтобы последующие
+        # log_turn не мутировали данные под потоком-писателем; сами
+        # строки и словари ходов разделяются.
+        self._sync_thoughts()
+        snapshot = {
+            **self.log_data,
+            "turns": list(self.log_data["turns"]),
+            "internal_thoughts_log": list(self.log_data["internal_thoughts_log"]),
+        }
+        self._write_queue.put((snapshot, filepath, pretty))
+        return filepath
+
+    def _writer_loop(self):
+        while True:
+            snapshot, filepath, pretty = self._write_queue.get()
+            try:
+                self._write_file(snapshot, filepath, pretty)
+            except OSError:
+                pass
+            finally:
+                self._write_queue.task_done()
+
+    def wait_pending(self):
+        """Блокирует до завершения всех отложенных сохранений."""
+        if self._write_queue is not None:
+            self._write_queue.join()
+
+    def save_pretty(self, filepath: str = None) -> str:
+        """Сохраняет лог с отступами — для чтения человеком."""
+        return self.save(filepath, pretty=True)
+
+    def save_msgpack(self, filepath: str = None) -> str:
+        """Сохраняет лог в бинарном формате MessagePack.
+
+        Требует установленный пакет msgpack; для чтения —
+        msgpack.unpack/unpackb.
+        """
+        if msgpack is None:
+            raise RuntimeError(
+                "Пакет msgpack не установлен; используйте save()"
+            )
+        if filepath is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filepath = f"logs/interview_log_{timestamp}.msgpack"
+
+        self._sync_thoughts()
+        self._ensure_parent(filepath)
+
+        with open(filepath, 'wb') as f:
+            f.write(msgpack.packb(self._materialize_turns(self.log_data)))
+
         return filepath
     
     def get_log_data(self) -> Dict[str, Any]:
         """Возвращает данные лога."""
+        self._sync_thoughts()
         return self.log_data
 
 
-def create_log_from_state(state: InterviewState, 
+# Мемоизация последнего результата create_log_from_state: сохранение и
+# отображение зовут функцию на одном состоянии подряд, а полная
+# пересборка — O(ходы + мысли). Ключ из id и длин — дешёвый сигнал
+# инвалидации: turns и internal_thoughts в интервью append-only, а
+# final_feedback заменяется целиком.
+_log_cache_key = None
+_log_cache_value = None
+
+
+def create_log_from_state(state: InterviewState,
                           team_name: str = "Multi-Agent Interview Coach") -> Dict[str, Any]:
     """Создаёт структуру лога из состояния интервью."""
+    global _log_cache_key, _log_cache_value
+
+    cache_key = (
+        id(state),
+        team_name,
+        len(state.get("turns", [])),
+        len(state.get("internal_thoughts", [])),
+        id(state.get("final_feedback")),
+    )
+    if cache_key == _log_cache_key:
+        return _log_cache_value
+
     log_data = {
         "team_name": team_name,
         "timestamp": datetime.now().isoformat(),
@@ -89,33 +432,46 @@ def create_log_from_state(state: InterviewState,
         "final_feedback": state.get("final_feedback", {})
     }
     
-    thoughts_by_turn = {}
+    # Группировка по реальному turn_id мысли. Прежний вариант считал
+    # номер хода как len(thoughts_by_turn) + 1 и после первой записи
+    # сваливал все мысли в один ход. Плоский журнал мыслей заполняется
+    # тем же проходом — второй обход списка не нужен.
+    thoughts_by_turn = defaultdict(list)
+    thoughts_log = log_data["internal_thoughts_log"]
     for thought in state.get("internal_thoughts", []):
-        turn_id = len(thoughts_by_turn) + 1
-        if turn_id not in thoughts_by_turn:
-            thoughts_by_turn[turn_id] = []
-        thoughts_by_turn[turn_id].append(thought)
+        thoughts_by_turn[thought.get("turn_id", 0)].append(thought)
+        thoughts_log.append({
+            "from": sys.intern(thought["from_agent"]),
+            "to": sys.intern(thought["to_agent"]),
+            "content": thought["content"],
+            "timestamp": thought_timestamp(thought)
+        })
     
     for turn in state.get("turns", []):
         turn_thoughts = thoughts_by_turn.get(turn["turn_id"], [])
         thoughts_str = " ".join([
-            f"[{t['from_agent']}]: {t['content']}" 
+            f"[{t['from_agent']}]: {t['content']}"
             for t in turn_thoughts
         ])
-        
-        log_data["turns"].append({
-            "turn_id": turn["turn_id"],
-            "agent_visible_message": turn["agent_visible_message"],
-            "user_message": turn["user_message"],
-            "internal_thoughts": thoughts_str or turn.get("internal_thoughts", "")
-        })
-    
-    for thought in state.get("internal_thoughts", []):
-        log_data["internal_thoughts_log"].append({
-            "from": thought["from_agent"],
-            "to": thought["to_agent"],
-            "content": thought["content"],
-            "timestamp": thought.get("timestamp", "")
-        })
+
+        if isinstance(turn, dict):
+            # Копия через распаковку разделяет строки с исходным ходом
+            # и не перечисляет поля руками.
+            log_data["turns"].append({
+                **turn,
+                "internal_thoughts":
+                    thoughts_str or turn.get("internal_thoughts", "")
+            })
+        else:
+            # Слотовый Turn не распаковывается через ** — поля
+            # проецируются явно.
+            log_data["turns"].append({
+                "turn_id": turn["turn_id"],
+                "agent_visible_message": turn["agent_visible_message"],
+                "user_message": turn["user_message"],
+                "internal_thoughts":
+                    thoughts_str or turn.get("internal_thoughts", "")
+            })
     
+    _log_cache_key, _log_cache_value = cache_key, log_data
     return log_data